@@ -66,7 +66,7 @@ class JsonLoaderApp(QWidget):
         if file_name:
             try:
                 print(file_name)
-                self.json_data = pd.read_json(file_name)  # Store the JSON data in the class attribute
+                self.json_data = LoadLogFile.load_log(file_name)  # Store the JSON data in the class attribute
                 QMessageBox.information(self, 'Success', 'JSON file loaded successfully!')
                 self.train, self.val, self.test, le = LoadLogFile.prepare_log(self.json_data)
                 self.display_dataframe()
@@ -1,5 +1,11 @@
 import requests
+import numpy as np
 import pandas as pd
+from sklearn.feature_extraction import FeatureHasher
+from src.Preprocessing import Categorical
+
+#number of hash buckets for the String process variables, None falls back to One-Hot-Encoding
+STRING_HASH_BUCKETS = 256
 
 class NoTrainingDataAvailable(Exception):
     "There is no training data available for the given instance, all instances with corresponding definition key may be not active or the instance key may not exist."
@@ -11,7 +17,7 @@ class NoPredictionInputDataAvailable(Exception):
 
 #function to get the training data from the Connector API
 #the parameter columns is a list containing the columns that are in the prediction data
-def get_training_data(processDefinitionKey: str, columns: list):
+def get_training_data(processDefinitionKey: str, columns: list, hash_buckets=STRING_HASH_BUCKETS):
     print("Training method started")
     #URL definition (first for docker, second localhost)
     # url = "http://coppaconnector:8080/ConnectorExport/" + str(processDefinitionKey)
@@ -30,7 +36,9 @@ def get_training_data(processDefinitionKey: str, columns: list):
 
     #filling a Pandas dataframe with the data
     df = pd.json_normalize(data)
-    df = data_prep(df)
+    # A vocabulary per request, so the API process does not collect the categories of every process
+    df, _ = Categorical.Vocabulary().intern(df)
+    df = data_prep(df, hash_buckets)
 
     #columns, that are not in prediction data, are dropped
     for col in df.columns:
@@ -71,8 +79,23 @@ def get_prediction_input(processInstanceKey : str):
 
     return df
 
+#signed feature hashing of "column=value" tokens into a fixed number of columns
+#the width does not depend on the observed values, so training and prediction data share the same columns
+def hash_encode(df: pd.DataFrame, columns: list, hash_buckets=STRING_HASH_BUCKETS):
+    tokens = pd.DataFrame({col: col + "=" + df[col].astype(str) for col in columns}, index=df.index)
+    #missing values do not produce a token
+    tokens = tokens.where(df[columns].notna().values)
+    rows = [[token for token in row if isinstance(token, str)] for row in tokens.values.tolist()]
+    hashed = np.zeros((len(rows), hash_buckets), dtype=np.float32)
+    if len(rows) > 0:
+        hasher = FeatureHasher(n_features=hash_buckets, input_type="string", alternate_sign=True)
+        hashed = hasher.transform(rows).toarray().astype(np.float32)
+    hashed = pd.DataFrame(hashed, index=df.index,
+                          columns=["variablesStringHash_" + str(i) for i in range(hash_buckets)])
+    return pd.concat([df.drop(columns, axis=1), hashed], axis=1)
+
 #data preparation as a function that can also be used on the prediction data
-def data_prep(df: pd.DataFrame):
+def data_prep(df: pd.DataFrame, hash_buckets=STRING_HASH_BUCKETS):
 
     # drop the state as the state in the prediction input data is always 'ACTIVE'
     df = df.drop(['nodeState'], axis=1)
@@ -83,9 +106,16 @@ def data_prep(df: pd.DataFrame):
         if col.startswith('variablesString'):
             stringVars.append(col)
 
-    #One-Hot-Encoding
+    #One-Hot-Encoding, String variables are hashed unless hash_buckets is None
     cls = ['nodeType', 'bpmnProcessId', 'processState', 'flowNodeId']
-    cls.extend(stringVars)
+    if hash_buckets:
+        df = hash_encode(df, stringVars, hash_buckets)
+    else:
+        cls.extend(stringVars)
+    #interned columns share their categories with other logs, only observed values become dummy columns
+    for col in cls:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.remove_unused_categories()
     df = pd.get_dummies(df, columns = cls)
 
     #basic NaN handling. Booleans will be False, Strings will be 'missing' and Floats will be 0.0
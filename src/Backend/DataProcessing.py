@@ -1,41 +1,147 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 
 import pickle as pickle
 from src.Log import Reformat
+from src.Log.TraceStore import TraceStore
 from src.Preprocessing import Preprocess
+from src.Preprocessing import Timestamp
+from src.Preprocessing import Categorical
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.preprocessing import LabelEncoder
 
 
-def generate_trace(data, time_column="endDate", case_column="Case ID", selected_columns=[]):
-    data["nodeType"] = data["flowNodeId"].apply(lambda x: x[:4])
-    data_fin = data[data["nodeType"] == "Task"]
+def prepare_events(data, time_column="endDate", case_column="Case ID", selected_columns=[]):
+    data["nodeType"] = Categorical.prefix(data["flowNodeId"], 4)
+    data_fin = data[Categorical.equals(data["nodeType"], "Task")]
     data_fin = data_fin[selected_columns]
     data_fin = data_fin.rename(columns={case_column: "CaseID", time_column:"EndDate"})
-    data_fin["EndDate"] = data_fin["EndDate"].apply(pd.to_datetime)
+    data_fin["EndDate"], invalid = Timestamp.normalize_timestamps(data_fin["EndDate"])
+    data_fin = data_fin[~invalid]
+    return data_fin
+
+
+def generate_trace(data, time_column="endDate", case_column="Case ID", selected_columns=[]):
+    data_fin = prepare_events(data, time_column, case_column, selected_columns)
     data_trace = Reformat.roll_sequence(data_fin, time_column="EndDate", case_column="CaseID")
     data_trace = data_trace.reset_index()
-    data_trace["RemTime"] = data_trace["EndDate"].apply(Preprocess.cal_remtime)
-    data_trace["LapseTime"] = data_trace["EndDate"].apply(Preprocess.cal_lapse)
+    data_trace = Preprocess.add_time_targets(data_trace, "EndDate")
     return data_trace
 
 
-def onehot_encode(data, columns):
+class TraceBuilder():
+    # Keeps rolled traces and appends batches of new events to them, so a live log does not
+    # need generate_trace over the whole history for every new event
+    def __init__(self, time_column="endDate", case_column="Case ID", selected_columns=[]):
+        self.time_column = time_column
+        self.case_column = case_column
+        self.selected_columns = selected_columns
+        self.case_index = {}  # Case ID -> row in the per-case lists
+        self.case_ids = []
+        self.sequences = {}  # Column name -> list with one array per case
+        self.targets = {}  # Time target name -> list with one array per case
+
+    def add_events(self, data):
+        data_fin = prepare_events(data.copy(), self.time_column, self.case_column, self.selected_columns)
+        if data_fin.shape[0] == 0:
+            return []
+        batch_trace = Reformat.roll_sequence(data_fin, time_column="EndDate", case_column="CaseID")
+        for column in batch_trace.columns:
+            if column != "Start Time" and column not in self.sequences:
+                self.sequences[column] = [np.array([], dtype=object)] * len(self.case_ids)
+
+        # Only the cases that received events are touched
+        updated_rows = []
+        for case_id, row_data in zip(batch_trace.index, batch_trace.to_dict("records")):
+            row = self.case_index.get(case_id)
+            if row is None:
+                row = len(self.case_ids)
+                self.case_index[case_id] = row
+                self.case_ids.append(case_id)
+                for column, values in self.sequences.items():
+                    values.append(row_data[column])
+                for values in self.targets.values():
+                    values.append(None)
+            else:
+                for column, values in self.sequences.items():
+                    values[row] = np.concatenate([values[row], row_data[column]])
+            updated_rows.append(row)
+
+        time_stamps = [self.sequences["EndDate"][row] for row in updated_rows]
+        offsets = np.zeros(len(updated_rows) + 1, dtype=np.int64)
+        np.cumsum([len(stamps) for stamps in time_stamps], out=offsets[1:])
+        targets = Preprocess.cal_time_targets(np.concatenate(time_stamps), offsets)
+        for name, values in targets.items():
+            if name not in self.targets:
+                self.targets[name] = [None] * len(self.case_ids)
+            for i, row in enumerate(updated_rows):
+                self.targets[name][row] = values[offsets[i]:offsets[i + 1]]
+        return [self.case_ids[row] for row in updated_rows]
+
+    def get_trace(self):
+        # Same layout as generate_trace, building the frame costs O(number of cases)
+        data_trace = pd.DataFrame({"CaseID": self.case_ids})
+        for column, values in self.sequences.items():
+            data_trace[column] = pd.Series(values, dtype=object)
+        data_trace["Start Time"] = pd.Series([stamps[0] for stamps in self.sequences.get("EndDate", [])],
+                                             dtype=object).infer_objects()
+        for name, values in self.targets.items():
+            data_trace[name] = pd.Series(values, dtype=object)
+        data_trace = data_trace.sort_values("Start Time", ascending=True).reset_index(drop=True)
+        return data_trace
+
+
+def encode_flat(data, column, encoder, column_vector=True, transform=None):
+    # Fit once on the unique values and transform all events of the column in one call,
+    # the flat result is split back into cases by the trace offsets
+    store = TraceStore.from_frame(data[[column]], [column])
+    values = pd.unique(store.sequences[column])
+    if column_vector:
+        values = values.reshape((-1, 1))
+    encoder.fit(values)
+    if transform is None:
+        if column_vector:
+            transform = lambda x: encoder.transform(x.reshape((-1, 1)))
+        else:
+            transform = encoder.transform
+    store.map_flat(column, transform)
+    return store.to_frame()[column], encoder
+
+
+def encode_columns(data, columns, encode, num_threads=None):
+    # Columns are encoded in parallel threads, encode(column) returns the new column and its encoder
+    if num_threads is None:
+        num_threads = min(len(columns), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max(num_threads, 1)) as executor:
+        results = dict(zip(columns, executor.map(encode, columns)))
     encoder_dict = {}
-    for column_to_encode in columns:
-        enc = OneHotEncoder(sparse_output=False)
-        enc.fit(data[column_to_encode].explode(column_to_encode).unique().reshape((-1, 1)))
-        data[column_to_encode] = data[column_to_encode].apply(lambda x: enc.transform(x.reshape((-1, 1))))
-        encoder_dict[column_to_encode] = enc
+    for column, (values, encoder) in results.items():
+        data[column] = values
+        encoder_dict[column] = encoder
     return data, encoder_dict
 
 
-def label_encode(data, columns):
-    encoder_dict = {}
-    for column_to_encode in columns:
-        enc = LabelEncoder()
-        enc.fit(data[column_to_encode].explode(column_to_encode).unique().reshape((-1, 1)))
-        data[column_to_encode] = data[column_to_encode].apply(lambda x: enc.transform(x.reshape((-1, 1))))
-        encoder_dict[column_to_encode] = enc
+def onehot_encode(data, columns, sparse=False, num_threads=None):
+    # With sparse=True only the integer category codes are stored per event and the vocabulary size
+    # goes to data.attrs["onehot_size"], the one-hot vectors are expanded at batch time
+    def encode(column):
+        enc = OneHotEncoder(sparse_output=False)
+        if sparse:
+            to_codes = lambda x: pd.Index(enc.categories_[0]).get_indexer(x).astype(np.int32)
+            return encode_flat(data, column, enc, transform=to_codes)
+        return encode_flat(data, column, enc)
+
+    data, encoder_dict = encode_columns(data, columns, encode, num_threads)
+    if sparse:
+        data.attrs["onehot_size"] = {**data.attrs.get("onehot_size", {}),
+                                     **{column: len(enc.categories_[0]) for column, enc in encoder_dict.items()}}
     return data, encoder_dict
+
+
+def label_encode(data, columns, num_threads=None):
+    def encode(column):
+        return encode_flat(data, column, LabelEncoder(), column_vector=False)
+
+    return encode_columns(data, columns, encode, num_threads)
@@ -1,15 +1,28 @@
 import numpy as np
 import pandas as pd
 from src.Log import Reformat
+from src.Log import StreamReader
 from src.Preprocessing import Extraction
 from src.Preprocessing import Preprocess
+from src.Preprocessing import Categorical
+from src.Utils import LogCache
+
+
+def load_log(file_path, use_cache=True, intern=True):
+    # Stream the JSON export into typed column buffers instead of building a list of dicts
+    if use_cache:
+        data = LogCache.default_cache.load(file_path, StreamReader.read_json_log, tag="json_stream")
+    else:
+        data = StreamReader.read_json_log(file_path)
+    if intern:
+        data, _ = Categorical.intern_columns(data)
+    return data
 
 
 def prepare_log(json_log):
     data_trace = Reformat.roll_sequence(Extraction.extract(json_log), time_column="endDate", case_column="Case ID")
     data_trace = data_trace.reset_index()
-    data_trace["RemTime"] = data_trace["endDate"].apply(Preprocess.cal_remtime)
-    data_trace["LapseTime"] = data_trace["endDate"].apply(Preprocess.cal_lapse)
+    data_trace = Preprocess.add_time_targets(data_trace, "endDate")
     train, val, test, le = Preprocess.split_encode(data_trace, ["Activity"])
 
     return train, val, test, le
@@ -40,21 +40,31 @@ def train_xgb_predictor(training_set, validation_set, test_set, parameter):
 
 def train_LSTM_predictor(training_set, validation_set, test_set, parameter):
     predictor = None
+    # With num_workers set, batches come from a length-bucketed DataLoader
+    loader_config = None
+    if parameter.get("num_workers") is not None:
+        loader_config = {"num_workers": parameter["num_workers"], "pin_memory": torch.cuda.is_available(),
+                         "bucket_width": parameter.get("bucket_width", 1),
+                         "shuffle_buffer": parameter.get("shuffle_buffer"), "seed": parameter.get("seed")}
     if parameter["task"] == "Regression":
         optimizer = torch.optim.NAdam
         loss = nn.L1Loss()
         predictor = Regressor.LstmRegressor(training_set, validation_set,
                                             parameter["hidden_size"], parameter["num_layers"],
                                             optimizer, loss, parameter["batch_size"],
-                                            parameter["max_iter"], parameter["patience"])
+                                            parameter["max_iter"], parameter["patience"],
+                                            parameter.get("embedding_dim", 16), loader_config,
+                                            parameter.get("seq2seq", False))
     elif parameter["task"] == "Classification":
         optimizer = torch.optim.NAdam
         loss = nn.CrossEntropyLoss()
-        num_class = training_set[:][1].shape[-1]
+        num_class = training_set.num_classes()
         predictor = Classifier.LstmClassifier(training_set, validation_set,
                                               parameter["hidden_size"], parameter["num_layers"],
                                               num_class, optimizer, loss, parameter["batch_size"],
-                                              parameter["max_iter"], parameter["patience"])
+                                              parameter["max_iter"], parameter["patience"],
+                                              parameter.get("embedding_dim", 16), loader_config,
+                                              parameter.get("seq2seq", False))
     if predictor:
         predictor.train()
         test_res, test_ref = predictor.predict(test_set)
@@ -71,12 +81,21 @@ def train_LSTM_predictor(training_set, validation_set, test_set, parameter):
 
 def training_pipline(log, parameter):
     train, val, test = split_data(log, parameter["training_ratio"], parameter["validation_ratio"])
+    # Variant compression only for training and validation, the test scores stay per case
+    weighted = parameter.get("weighted", False)
+    # Sparse one-hot columns are fed to the LSTM as embedding indices
+    embedding = parameter.get("embedding", False) and parameter["model"] == "LSTM"
+    label_ids = parameter["task"] == "Classification"
     train_set = CaseDataSet.CaseDataset(train, feature_list=parameter["feature"],
-                                        label=parameter["label"], encoding=parameter["encoding"])
+                                        label=parameter["label"], encoding=parameter["encoding"],
+                                        weighted=weighted, embedding=embedding, label_ids=label_ids,
+                                        seed=parameter.get("seed"))
     val_set = CaseDataSet.CaseDataset(val, feature_list=parameter["feature"],
-                                      label=parameter["label"], encoding=parameter["encoding"])
+                                      label=parameter["label"], encoding=parameter["encoding"],
+                                      weighted=weighted, embedding=embedding, label_ids=label_ids)
     test_set = CaseDataSet.CaseDataset(val, feature_list=parameter["feature"],
-                                       label=parameter["label"], encoding=parameter["encoding"])
+                                       label=parameter["label"], encoding=parameter["encoding"],
+                                       embedding=embedding, label_ids=label_ids)
 
     predictor, val_stat, test_score = None, None, None
     if parameter["model"] == "XGBoost":
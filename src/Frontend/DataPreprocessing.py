@@ -39,6 +39,7 @@ class FeatureEngineeringWidget(QWidget):
         # Dropdown to select an encoding technique
         self.encoding_combo_box = QListWidget(self)
         self.encoding_combo_box.addItem("One-Hot Encoding")
+        self.encoding_combo_box.addItem("Sparse One-Hot Encoding")
         self.encoding_combo_box.addItem("Label Encoding")
         main_layout.addWidget(QLabel("Select Encoding Technique:", self))
         main_layout.addWidget(self.encoding_combo_box)
@@ -88,6 +89,8 @@ class FeatureEngineeringWidget(QWidget):
                     encoders = None
                     if encoding_type == "One-Hot Encoding":
                         encoded_df, encoders = DataProcessing.onehot_encode(df, columns_to_encode)
+                    elif encoding_type == "Sparse One-Hot Encoding":
+                        encoded_df, encoders = DataProcessing.onehot_encode(df, columns_to_encode, sparse=True)
                     elif encoding_type == "Label Encoding":
                         encoded_df, encoders = DataProcessing.label_encode(df, columns_to_encode)
 
@@ -1,7 +1,5 @@
 import sys
 import os
-import json
-import pandas as pd
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog,
     QMessageBox, QListWidget, QLabel, QLineEdit, QTableWidget, QTableWidgetItem,
@@ -10,6 +8,7 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import QTimer, Qt, pyqtSignal
 import qtmodern.styles
 import qtmodern.windows
+from src.Backend import LoadLogFile
 
 class DeselectableListWidget(QListWidget):
     def __init__(self, parent=None):
@@ -78,7 +77,7 @@ class JsonLoaderApp(QWidget):
 
     def __init__(self,parent=None):
         super().__init__(parent)
-        self.json_data_dict = {}  # Dictionary to store loaded JSON data keyed by file name
+        self.json_data_dict = {}  # Dictionary to store loaded JSON file paths keyed by file name
         self.dataframes_dict = {}  # Dictionary to store converted DataFrames
         self.selection_timer = QTimer()
         self.selection_timer.setSingleShot(True)
@@ -175,16 +174,17 @@ class JsonLoaderApp(QWidget):
         for file_name in file_names:
             if file_name:
                 try:
-                    with open(file_name, 'r') as file:
-                        data = json.load(file)  # Load the JSON data
-                        base_name = os.path.basename(file_name)  # Get the base file name
-                        name = base_name
-                        self.json_data_dict[name] = data  # Store the JSON data in the dictionary
-
-                        # Add the file name to the list widget
-                        if not self.file_list_widget.findItems(base_name, Qt.MatchExactly):
-                            self.file_list_widget.addItem(base_name)
-                        loaded_files.append(base_name)
+                    if not os.path.isfile(file_name):
+                        raise FileNotFoundError(file_name)
+                    base_name = os.path.basename(file_name)  # Get the base file name
+                    name = base_name
+                    # Only the path is kept, the log is streamed into columns on conversion
+                    self.json_data_dict[name] = file_name
+
+                    # Add the file name to the list widget
+                    if not self.file_list_widget.findItems(base_name, Qt.MatchExactly):
+                        self.file_list_widget.addItem(base_name)
+                    loaded_files.append(base_name)
 
                 except Exception as e:
                     QMessageBox.critical(self, 'Error', f"Could not load JSON file:\n{e}")
@@ -224,11 +224,11 @@ class JsonLoaderApp(QWidget):
 
         converted_files = []
 
-        for file_name, data in self.json_data_dict.items():
+        for file_name, file_path in self.json_data_dict.items():
             try:
                 converted_file_name = file_name.replace('.json', '_df')
-                # Convert JSON data to a Pandas DataFrame
-                df = pd.DataFrame(data)
+                # Stream the JSON file into a Pandas DataFrame
+                df = LoadLogFile.load_log(file_path)
                 self.dataframes_dict[converted_file_name] = df  # Store the DataFrame in the dictionary
 
 
@@ -50,6 +50,10 @@ class TrainingConfigure(QWidget):
         self.temporal_ordering_checkbox.setChecked(True)  # Checked by default
         data_split_layout.addWidget(self.temporal_ordering_checkbox)
 
+        # Checkbox for training on weighted case variants instead of single cases
+        self.weighted_checkbox = QCheckBox("Compress case variants", self)
+        data_split_layout.addWidget(self.weighted_checkbox)
+
         # Add the data split group box to the left layout
         left_layout.addWidget(data_split_group)
 
@@ -146,6 +150,7 @@ class TrainingConfigure(QWidget):
             self.max_iter_entry = self.create_float_entry("Maximum iterations:")
             self.patience_entry = self.create_float_entry("Patience iterations:")
             self.optimizer_combo_box = self.create_combo_box("Optimizer:", ["Nadam", "Adam", "SGD"])
+            self.embedding_checkbox = QCheckBox("Embedding input for sparse one-hot columns", self)
             self.model_specific_layout.addWidget(self.hidden_size_entry["label"])
             self.model_specific_layout.addWidget(self.hidden_size_entry["entry"])
             self.model_specific_layout.addWidget(self.num_layers_entry["label"])
@@ -160,13 +165,16 @@ class TrainingConfigure(QWidget):
             self.model_specific_layout.addWidget(self.patience_entry["entry"])
             self.model_specific_layout.addWidget(self.optimizer_combo_box["label"])
             self.model_specific_layout.addWidget(self.optimizer_combo_box["combo_box"])
+            self.model_specific_layout.addWidget(self.embedding_checkbox)
 
         elif self.model_combo_box.currentText() == "XGBoost":
             # Create model-specific input fields (XGBoost)
             self.early_stopping_entry = self.create_int_entry("Early stopping rounds:")
             self.subsample_rate_entry = self.create_float_entry("Sub-sample rate:")
             self.tree_method_combo_box = self.create_combo_box("Tree method:", ["hist", "approx"])
-            self.encoding_combo_box = self.create_combo_box("Encoding technique:", ["Last encoding", "Aggregation"])
+            self.encoding_combo_box = self.create_combo_box("Encoding technique:", ["Last encoding", "Aggregation",
+                                                                                   "Sum aggregation", "Min aggregation",
+                                                                                   "Max aggregation"])
             self.model_specific_layout.addWidget(self.early_stopping_entry["label"])
             self.model_specific_layout.addWidget(self.early_stopping_entry["entry"])
             self.model_specific_layout.addWidget(self.subsample_rate_entry["label"])
@@ -216,6 +224,7 @@ class TrainingConfigure(QWidget):
             self.config["validation_ratio"] = validation_ratio
             self.config["test_ratio"] = test_ratio
             self.config["temporal_ordering"] = self.temporal_ordering_checkbox.isChecked()
+            self.config["weighted"] = self.weighted_checkbox.isChecked()
             if self.next_step_checkbox.isChecked():
                 self.config["label"] = "Next_" + self.column_selector.currentText()
             else:
@@ -234,6 +243,7 @@ class TrainingConfigure(QWidget):
                 self.config["patience"] = int(self.patience_entry["entry"].text())
                 self.config["learning_rate"] = float(self.learning_rate_entry["entry"].text())
                 self.config["optimizer"] = self.optimizer_combo_box["combo_box"].currentText()
+                self.config["embedding"] = self.embedding_checkbox.isChecked()
                 self.config["encoding"] = "all"
             elif selected_model == "XGBoost":
                 self.config["early_stopping_rounds"] = int(self.early_stopping_entry["entry"].text())
@@ -244,6 +254,12 @@ class TrainingConfigure(QWidget):
                     self.config["encoding"] = "Last"
                 elif self.encoding_combo_box["combo_box"].currentText() == "Aggregation":
                     self.config["encoding"] = "Agg_Mean"
+                elif self.encoding_combo_box["combo_box"].currentText() == "Sum aggregation":
+                    self.config["encoding"] = "Agg_Sum"
+                elif self.encoding_combo_box["combo_box"].currentText() == "Min aggregation":
+                    self.config["encoding"] = "Agg_Min"
+                elif self.encoding_combo_box["combo_box"].currentText() == "Max aggregation":
+                    self.config["encoding"] = "Agg_Max"
 
             self.config_generated.emit(self.config)
             # Display confirmation message
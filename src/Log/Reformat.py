@@ -3,15 +3,24 @@ import numpy as np
 
 
 def roll_sequence(data, time_column="EndTime", case_column="CaseID"):
-    trace = None
+    # Group rows once by case (stable, so events keep their order inside a case)
+    # and cut every column with the same case boundaries
+    data = data[data[case_column].notna()]
+    case_codes, case_ids = pd.factorize(data[case_column], sort=True)
+    order = np.argsort(case_codes, kind="stable")
+    offsets = np.zeros(case_ids.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(case_codes, minlength=case_ids.shape[0]), out=offsets[1:])
+    index = pd.Index(case_ids, name=case_column)
+
+    trace = pd.DataFrame(index=index)
     for column in data.columns:
         if column != case_column:
-            data_col = data.groupby(case_column)[column].apply(np.array)
-            if trace is None:
-                trace = data_col
-            else:
-                trace = pd.merge(trace, data_col, on=case_column, how='inner')
-    trace["Start Time"] = trace[time_column].apply(lambda x: x[0])
+            values = np.array(data[column].iloc[order])
+            cells = np.empty(case_ids.shape[0], dtype=object)
+            for i in range(case_ids.shape[0]):
+                cells[i] = values[offsets[i]:offsets[i + 1]]
+            trace[column] = cells
+    trace["Start Time"] = pd.Series(data[time_column].iloc[order[offsets[:-1]]].array, index=index)
     trace = trace.sort_values("Start Time", ascending=True)
 
     return trace
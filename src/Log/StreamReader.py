@@ -0,0 +1,196 @@
+import json
+from array import array
+import numpy as np
+import pandas as pd
+from src.Preprocessing import Timestamp
+
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+
+
+class _ObjectColumn:
+    # Fallback buffer for columns without a declared type, dtype is inferred at the end
+    def __init__(self, num_missing=0):
+        self.values = [None] * num_missing
+
+    def append(self, value):
+        self.values.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def flush(self):
+        pass
+
+    def to_series(self):
+        return pd.Series(self.values)
+
+
+class _IntColumn:
+    def __init__(self, num_missing=0):
+        self.values = array("q", bytes(8 * num_missing))
+        self.missing = bytearray(b"\x01" * num_missing)
+
+    def append(self, value):
+        if value is None:
+            self.values.append(0)
+            self.missing.append(1)
+        else:
+            self.values.append(int(value))
+            self.missing.append(0)
+
+    def __len__(self):
+        return len(self.values)
+
+    def flush(self):
+        pass
+
+    def to_series(self):
+        values = np.frombuffer(self.values, dtype=np.int64).copy()
+        mask = np.frombuffer(self.missing, dtype=bool)
+        if mask.any():
+            return pd.Series(pd.arrays.IntegerArray(values, mask.copy()))
+        return pd.Series(values)
+
+
+class _CategoryColumn:
+    def __init__(self, num_missing=0):
+        self.vocabulary = {}
+        self.codes = array("i", [-1] * num_missing)
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+            return
+        code = self.vocabulary.get(value)
+        if code is None:
+            code = len(self.vocabulary)
+            self.vocabulary[value] = code
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def flush(self):
+        pass
+
+    def to_series(self):
+        codes = np.frombuffer(self.codes, dtype=np.int32).copy()
+        return pd.Series(pd.Categorical.from_codes(codes, categories=list(self.vocabulary)))
+
+
+class _TimeColumn:
+    # Raw strings are kept only until the next flush and then parsed in one vectorized call
+    def __init__(self, name, num_missing=0):
+        self.name = name
+        self.pending = [None] * num_missing
+        self.chunks = []
+        self.invalid_chunks = []  # Masks of the values that could not be parsed, in row order
+
+    def append(self, value):
+        self.pending.append(value)
+
+    def __len__(self):
+        return sum(chunk.shape[0] for chunk in self.chunks) + len(self.pending)
+
+    def flush(self):
+        if self.pending:
+            stamps, invalid = Timestamp.normalize_timestamps(pd.Series(self.pending, dtype=object), self.name)
+            self.chunks.append(stamps.array.asi8.copy())
+            self.invalid_chunks.append(invalid.to_numpy())
+            self.pending = []
+
+    def to_series(self):
+        self.flush()
+        values = np.concatenate(self.chunks) if self.chunks else np.empty(0, dtype=np.int64)
+        return pd.Series(values.view("datetime64[ns]")).dt.tz_localize("UTC")
+
+    def invalid_rows(self):
+        self.flush()
+        if not self.invalid_chunks:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(np.concatenate(self.invalid_chunks))
+
+
+def iter_records(file, chunk_size=1 << 20):
+    # Incrementally decode the elements of a top-level JSON array without loading the whole file
+    buffer = file.read(chunk_size)
+    pos = 0
+    eof = False
+    started = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in _whitespace:
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON event log")
+            buffer, pos = buffer[pos:] + file.read(chunk_size), 0
+            eof = pos >= len(buffer)
+            continue
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("JSON event log must be a top-level array of events")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+        if buffer[pos] == ",":
+            pos += 1
+            continue
+        try:
+            record, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        if not isinstance(record, dict):
+            raise ValueError("JSON event log entries must be objects")
+        yield record
+        pos = end
+        if pos > chunk_size:
+            buffer, pos = buffer[pos:], 0
+
+
+def read_json_log(file_path, int_columns=("processInstanceKey",), category_columns=("flowNodeId",),
+                  time_columns=("startDate", "endDate"), chunk_size=1 << 20, batch_size=1 << 16, verbose=False):
+    # Rows whose timestamp could not be parsed are NaT, their row numbers are kept per column
+    # in data.attrs["invalid_timestamps"]
+    columns = {}
+    num_rows = 0
+    with open(file_path, "r") as file:
+        for record in iter_records(file, chunk_size):
+            for key, value in record.items():
+                column = columns.get(key)
+                if column is None:
+                    if key in int_columns:
+                        column = _IntColumn(num_rows)
+                    elif key in category_columns:
+                        column = _CategoryColumn(num_rows)
+                    elif key in time_columns:
+                        column = _TimeColumn(key, num_rows)
+                    else:
+                        column = _ObjectColumn(num_rows)
+                    columns[key] = column
+                column.append(value)
+            num_rows += 1
+            # Keys absent from this record are filled with missing values
+            if len(record) != len(columns):
+                for column in columns.values():
+                    if len(column) < num_rows:
+                        column.append(None)
+            if num_rows % batch_size == 0:
+                for column in columns.values():
+                    column.flush()
+
+    data = pd.DataFrame({key: column.to_series() for key, column in columns.items()})
+    invalid_timestamps = {key: column.invalid_rows().tolist() for key, column in columns.items()
+                          if isinstance(column, _TimeColumn)}
+    data.attrs["invalid_timestamps"] = {key: rows for key, rows in invalid_timestamps.items() if rows}
+    if verbose:
+        for key, rows in data.attrs["invalid_timestamps"].items():
+            print(f"{len(rows)} timestamp(s) in column {key} could not be parsed, first rows: {rows[:5]}")
+    return data
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class TraceStore():
+    # Ragged (CSR) storage of rolled traces: every sequence attribute is one flat array over all
+    # events, and offsets[i]:offsets[i+1] marks the events of case i
+    def __init__(self, sequences, offsets, case_data=None):
+        self.sequences = sequences  # Column name -> flat array, first axis are events
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.case_data = case_data  # DataFrame with one row per case for scalar columns
+        if self.case_data is None:
+            self.case_data = pd.DataFrame(index=pd.RangeIndex(self.num_cases))
+
+    @classmethod
+    def from_frame(cls, data, sequence_columns=None):
+        if sequence_columns is None:
+            sequence_columns = [column for column in data.columns
+                                if data.shape[0] > 0 and isinstance(data[column].values[0], np.ndarray)]
+        lengths = None
+        sequences = {}
+        for column in sequence_columns:
+            values = data[column].values
+            column_lengths = np.fromiter((len(value) for value in values), dtype=np.int64, count=values.shape[0])
+            if lengths is None:
+                lengths = column_lengths
+            elif not np.array_equal(lengths, column_lengths):
+                raise ValueError(f"Column {column} has different case lengths than {sequence_columns[0]}")
+            if values.shape[0] > 0:
+                sequences[column] = np.concatenate(values)
+            else:
+                sequences[column] = np.empty(0)
+        if lengths is None:
+            lengths = np.zeros(data.shape[0], dtype=np.int64)
+        offsets = np.zeros(lengths.shape[0] + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        case_data = data.drop(columns=sequence_columns)
+        return cls(sequences, offsets, case_data)
+
+    def to_frame(self):
+        # Back to one row per case with a small array per cell, the cells are views into the flat arrays
+        data = self.case_data.copy()
+        for column, values in self.sequences.items():
+            cells = np.empty(self.num_cases, dtype=object)
+            for i in range(self.num_cases):
+                cells[i] = values[self.offsets[i]:self.offsets[i + 1]]
+            data[column] = cells
+        return data
+
+    @property
+    def num_cases(self):
+        return self.offsets.shape[0] - 1
+
+    @property
+    def num_events(self):
+        return int(self.offsets[-1])
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return self.num_cases
+
+    def columns(self):
+        return list(self.sequences.keys())
+
+    def case_index(self):
+        # Case number of every event
+        return np.repeat(np.arange(self.num_cases), self.lengths)
+
+    def position(self):
+        # Position of every event inside its case, starting at 0
+        return np.arange(self.num_events) - np.repeat(self.offsets[:-1], self.lengths)
+
+    def case(self, idx, prefix_len=None):
+        # Zero-copy views on the events of one case, optionally cut to a prefix
+        start = self.offsets[idx]
+        end = self.offsets[idx + 1]
+        if prefix_len is not None:
+            end = min(end, start + prefix_len)
+        return {column: values[start:end] for column, values in self.sequences.items()}
+
+    def first(self, column):
+        self.check_not_empty()
+        return self.sequences[column][self.offsets[:-1]]
+
+    def last(self, column):
+        self.check_not_empty()
+        return self.sequences[column][self.offsets[1:] - 1]
+
+    def check_not_empty(self):
+        # An empty case has no first or last event, its offset points into the neighbouring case
+        empty = np.flatnonzero(self.lengths == 0)
+        if empty.shape[0] > 0:
+            raise ValueError(f"Cases {empty[:10].tolist()} have no events")
+
+    def select(self, cases):
+        # Subset of cases, a contiguous slice shares memory with this store
+        if isinstance(cases, slice):
+            start, stop, step = cases.indices(self.num_cases)
+            if step == 1:
+                stop = max(start, stop)
+                event_slice = slice(self.offsets[start], self.offsets[stop])
+                sequences = {column: values[event_slice] for column, values in self.sequences.items()}
+                offsets = self.offsets[start:stop + 1] - self.offsets[start]
+                return TraceStore(sequences, offsets, self.case_data.iloc[start:stop])
+            cases = np.arange(start, stop, step)
+        cases = np.asarray(cases)
+        if cases.dtype == bool:
+            cases = np.flatnonzero(cases)
+        lengths = self.lengths[cases]
+        offsets = np.zeros(cases.shape[0] + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        event_idx = np.repeat(self.offsets[cases] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        sequences = {column: values[event_idx] for column, values in self.sequences.items()}
+        return TraceStore(sequences, offsets, self.case_data.iloc[cases])
+
+    def prefix_index(self, prefix_len, min_len=None):
+        # Cases long enough for the prefix and the (cases, prefix_len) matrix of their event positions
+        if min_len is None:
+            min_len = prefix_len
+        cases = np.flatnonzero(self.lengths >= min_len)
+        event_idx = self.offsets[cases][:, None] + np.arange(prefix_len)[None, :]
+        return cases, event_idx
+
+    def prefix(self, column, prefix_len, min_len=None):
+        # Prefixes of length prefix_len of all long enough cases, stacked to (cases, prefix_len, ...)
+        cases, event_idx = self.prefix_index(prefix_len, min_len)
+        return cases, self.sequences[column][event_idx]
+
+    def accumulate(self, column, ufunc=np.add):
+        # Running ufunc over the events of every case, row e aggregates the events from its case start up to e.
+        # One vectorized step per position, so the cost is O(events) instead of O(events * case length)
+        values = np.asarray(self.sequences[column])
+        running = values.astype(np.result_type(values.dtype, np.float64))
+        positions = self.position()
+        order = np.argsort(positions, kind="stable")
+        bounds = np.zeros(int(positions.max(initial=0)) + 2, dtype=np.int64)
+        np.cumsum(np.bincount(positions, minlength=bounds.shape[0] - 1), out=bounds[1:])
+        for pos in range(1, bounds.shape[0] - 1):
+            events = order[bounds[pos]:bounds[pos + 1]]
+            running[events] = ufunc(running[events - 1], values[events])
+        return running
+
+    def accumulate_counts(self, column, num_codes):
+        # Sparse (events, num_codes) matrix of how often each code occurred in its case up to the event
+        codes = np.asarray(self.sequences[column]).astype(np.int64)
+        cases = self.case_index()
+        order = np.lexsort((np.arange(self.num_events), codes, cases))
+        # Occurrence j of a code in a case holds the count j from its event up to the next occurrence
+        same = (cases[order][1:] == cases[order][:-1]) & (codes[order][1:] == codes[order][:-1])
+        ends = np.where(np.append(same, False), np.append(order[1:], 0), self.offsets[1:][cases[order]])
+        group_start = np.flatnonzero(np.insert(~same, 0, True))
+        group_len = np.diff(np.append(group_start, order.shape[0]))
+        counts = np.arange(order.shape[0]) - np.repeat(group_start, group_len) + 1
+        span = ends - order
+        rows = np.repeat(order - (np.cumsum(span) - span), span) + np.arange(int(span.sum()))
+        values = np.repeat(counts, span).astype(np.float64)
+        return sparse.csr_matrix((values, (rows, np.repeat(codes[order], span))), shape=(self.num_events, num_codes))
+
+    def map_flat(self, column, func, new_column=None):
+        # Apply a vectorized function to all events of a column at once
+        values = func(self.sequences[column])
+        if values.shape[0] != self.num_events:
+            raise ValueError("Function must return one value per event")
+        self.sequences[new_column or column] = values
+        return self
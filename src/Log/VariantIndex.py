@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def sequence_key(arrays, slices):
+    # Hashable key of the given (sliced) per-case arrays
+    key = []
+    for values, cut in zip(arrays, slices):
+        values = np.ascontiguousarray(values[cut])
+        key.append((values.shape, values.tobytes()))
+    return tuple(key)
+
+
+class VariantIndex():
+    # Groups cases with identical sequences in the given columns, so each variant is stored once with its count
+    def __init__(self, data, columns, slices=None, weights=None):
+        if slices is None:
+            slices = [slice(None)] * len(columns)
+        variant_of_key = {}
+        self.codes = np.empty(data.shape[0], dtype=np.int64)
+        for i, row in enumerate(zip(*(data[column].values for column in columns))):
+            self.codes[i] = variant_of_key.setdefault(sequence_key(row, slices), len(variant_of_key))
+        self.num_variants = len(variant_of_key)
+        _, self.representatives = np.unique(self.codes, return_index=True)
+        if weights is None:
+            weights = np.ones(data.shape[0])
+        self.counts = np.bincount(self.codes, weights=weights, minlength=self.num_variants)
+
+    def compress(self, data, weight_column="Weight"):
+        # One row per variant, the weight column holds how many (weighted) cases it stands for
+        data_variant = data.iloc[self.representatives].copy()
+        data_variant[weight_column] = self.counts
+        return data_variant
@@ -1,24 +1,45 @@
 import torch
 from torch import nn
+from torch.nn.utils.rnn import pack_padded_sequence
 
 
 class SimpleLSTM(nn.Module):
-    def __init__(self, input_size, hidden_size, num_layers, num_classes):
+    # With vocab_sizes the input is a (codes, continuous) pair, every code column gets its own
+    # nn.Embedding and input_size only counts the continuous features
+    def __init__(self, input_size, hidden_size, num_layers, num_classes, vocab_sizes=None, embedding_dim=16):
         super(SimpleLSTM, self).__init__()
         self.hidden_size = hidden_size
         self.num_layers = num_layers
+        self.embeddings = nn.ModuleList([nn.Embedding(size, embedding_dim) for size in vocab_sizes or []])
+        input_size = input_size + embedding_dim * len(self.embeddings)
         self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True)
         self.fc = nn.Linear(hidden_size, num_classes)
 
-    def forward(self, x):
+    def embed(self, x):
+        codes, continuous = x
+        embedded = [embedding(codes[..., i]) for i, embedding in enumerate(self.embeddings)]
+        return torch.cat(embedded + [continuous.float()], dim=-1)
+
+    def forward(self, x, all_steps=False, lengths=None):
+        # With all_steps the head is applied at every timestep, step t is the prediction for the prefix
+        # of length t + 1 of a right-padded sequence. With lengths a right-padded batch of prefixes is
+        # packed and every row is predicted from its own last event
+        if isinstance(x, tuple):
+            x = self.embed(x)
         # Set initial hidden and cell states
         h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
         c0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
 
+        if lengths is not None and not all_steps:
+            packed = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+            _, (h_n, _) = self.lstm(packed, (h0, c0))
+            return self.fc(h_n[-1])
+
         # Forward propagate LSTM
         out, _ = self.lstm(x, (h0, c0))  # out: tensor of shape (batch_size, seq_length, hidden_size)
 
-        out = out[:, -1, :]
+        if not all_steps:
+            out = out[:, -1, :]
         out = self.fc(out)
         return out
 
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+
+INTERN_COLUMNS = ["flowNodeId", "nodeType", "nodeState", "processState", "bpmnProcessId"]
+
+
+class Vocabulary():
+    def __init__(self):
+        self.categories = {}  # Column name -> pd.Index of known values in order of first appearance
+
+    def intern(self, data, columns=INTERN_COLUMNS, verbose=False):
+        # Replace repeated strings by categorical codes over a vocabulary shared by all interned logs
+        saved_bytes = 0
+        for column in columns:
+            if column not in data.columns:
+                continue
+            series = data[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                values = series.astype(object)
+            elif series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == "string":
+                values = series
+            else:
+                continue
+            memory_before = series.memory_usage(index=False, deep=True)
+
+            known = self.categories.get(column, pd.Index([], dtype=object))
+            unique_values = pd.Index(pd.unique(values.dropna()))
+            new_values = unique_values[known.get_indexer(unique_values) == -1]
+            if new_values.shape[0] > 0:
+                known = known.append(new_values)
+                self.categories[column] = known
+            codes = known.get_indexer(values)
+            data[column] = pd.Categorical.from_codes(codes, categories=known)
+            saved_bytes = saved_bytes + memory_before - data[column].memory_usage(index=False, deep=True)
+
+        if verbose and saved_bytes > 0:
+            print(f"Interned categorical columns, saved {saved_bytes / 2 ** 20:.2f} MiB")
+        return data, saved_bytes
+
+    def align(self, data, columns=INTERN_COLUMNS):
+        # Cast interned columns to the full vocabulary, frames interned before later additions then share
+        # one category list (new categories are only appended, so the codes stay valid)
+        for column in columns:
+            if column not in data.columns or column not in self.categories:
+                continue
+            if isinstance(data[column].dtype, pd.CategoricalDtype) and \
+                    not data[column].cat.categories.equals(self.categories[column]):
+                data[column] = data[column].cat.set_categories(self.categories[column])
+        return data
+
+
+# Shared by the logs of one desktop session, long-running processes should intern with their own Vocabulary
+shared_vocabulary = Vocabulary()
+
+
+def intern_columns(data, columns=INTERN_COLUMNS, verbose=False):
+    return shared_vocabulary.intern(data, columns, verbose)
+
+
+def equals(column, value):
+    # Element-wise column == value, evaluated on the integer codes for categorical columns
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        code = column.cat.categories.get_indexer([value])[0]
+        if code < 0:
+            return pd.Series(False, index=column.index)
+        return pd.Series(column.cat.codes.to_numpy() == code, index=column.index)
+    return column == value
+
+
+def prefix(column, length):
+    # Element-wise x[:length], computed once per category for categorical columns
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        heads = column.cat.categories.astype(str).str[:length]
+        head_codes, head_categories = pd.factorize(heads)
+        codes = np.append(head_codes, -1)[column.cat.codes.to_numpy()]
+        return pd.Series(pd.Categorical.from_codes(codes, categories=head_categories), index=column.index)
+    return column.apply(lambda x: x[:length])
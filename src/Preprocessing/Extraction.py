@@ -1,11 +1,14 @@
 import pandas as pd
+from src.Preprocessing import Timestamp
+from src.Preprocessing import Categorical
 
 def extract(log):
-    data = log[log["nodeState"] == "COMPLETED"].drop(columns=["nodeState"])
-    data = data[data["processState"] == "COMPLETED"].drop(columns=["processState"])
-    data = data[data["nodeType"] == "USER_TASK"]
-    data["startDate"] = data["startDate"].apply(pd.to_datetime)
-    data["endDate"] = data["endDate"].apply(pd.to_datetime)
+    data = log[Categorical.equals(log["nodeState"], "COMPLETED")].drop(columns=["nodeState"])
+    data = data[Categorical.equals(data["processState"], "COMPLETED")].drop(columns=["processState"])
+    data = data[Categorical.equals(data["nodeType"], "USER_TASK")]
+    data["startDate"], invalid_start = Timestamp.normalize_timestamps(data["startDate"])
+    data["endDate"], invalid_end = Timestamp.normalize_timestamps(data["endDate"])
+    data = data[~(invalid_start | invalid_end)]
     data = data.rename(columns={"processInstanceKey": "Case ID", "flowNodeId": "Activity"})
     data_core = data[["Case ID", "Activity", "endDate"]]
 
@@ -1,60 +1,128 @@
+import numpy as np
+import pandas as pd
 from torch import nn
 import torch
+from src.Log.TraceStore import TraceStore
 
 
 class CustomLabelEncoder:
-    def __init__(self):
-        self.label_mapping = {}
-        self.classes_ = []
+    # Label encoder that keeps the order of first appearance, all methods work on whole arrays
+    # handle_unknown: "error" raises on unseen labels, "use_encoded_value" maps them to unknown_value
+    def __init__(self, handle_unknown="error", unknown_value=-1):
+        if handle_unknown not in ("error", "use_encoded_value"):
+            raise ValueError(f"Invalid handle_unknown: {handle_unknown}")
+        self.handle_unknown = handle_unknown
+        self.unknown_value = unknown_value
+        self.categories = pd.Index([], dtype=object)
+        self.counts = np.zeros(0, dtype=np.int64)  # Number of encoded occurrences per class
+        self._inverse = None
+        self._distribution = None
+
+    @property
+    def classes_(self):
+        return list(self.categories)
+
+    @property
+    def label_mapping(self):
+        return dict(zip(self.categories, range(len(self.categories))))
 
     def fit(self, labels):
-        # Create a mapping from label to integer based on order of appearance
-        for label in labels:
-            if label not in self.label_mapping:
-                self.label_mapping[label] = len(self.label_mapping)
-                self.classes_.append(label)
+        # New labels are appended in order of appearance, so repeated fits extend the mapping
+        uniques = pd.Index(pd.unique(pd.Series(np.asarray(labels, dtype=object).ravel())))
+        new_labels = uniques[self.categories.get_indexer(uniques) == -1]
+        if new_labels.shape[0] > 0:
+            self.categories = self.categories.append(new_labels)
+            self._inverse = None
+        return self
 
     def transform(self, labels):
         # Transform labels to integers
-        return [self.label_mapping[label] for label in labels]
+        codes = self.categories.get_indexer(np.asarray(labels, dtype=object).ravel())
+        unknown = codes == -1
+        if unknown.any():
+            if self.handle_unknown == "error":
+                unseen = pd.unique(np.asarray(labels, dtype=object).ravel()[unknown])
+                raise KeyError(f"Unseen labels: {list(unseen[:5])}")
+            codes[unknown] = self.unknown_value
+        return codes.astype(np.int64)
 
     def fit_transform(self, labels):
         self.fit(labels)
         return self.transform(labels)
 
+    def update_counts(self, codes):
+        # Add encoded labels to the class counts, e.g. the events of newly appended cases
+        codes = np.asarray(codes).ravel()
+        codes = codes[(codes >= 0) & (codes < len(self.categories))]
+        counts = np.bincount(codes, minlength=len(self.categories))
+        counts[:self.counts.shape[0]] += self.counts
+        self.counts = counts
+        self._distribution = None
+
+    def partial_fit(self, labels):
+        # Fit new labels and count all given labels
+        self.fit(labels)
+        self.update_counts(self.transform(labels))
+        return self
+
+    @property
+    def distribution(self):
+        # Relative class frequencies as float32 vector over classes_, cached until the counts change
+        if self._distribution is None or self._distribution.shape[0] != len(self.categories):
+            distribution = np.zeros(len(self.categories), dtype=np.float32)
+            total = self.counts.sum()
+            if total > 0:
+                distribution[:self.counts.shape[0]] = self.counts / total
+            self._distribution = distribution
+        return self._distribution
+
     def inverse_transform(self, values):
-        # Reverse the label mapping
-        inverse_mapping = {v: k for k, v in self.label_mapping.items()}
-        return [inverse_mapping[value] for value in values]
+        # Reverse the label mapping through a lookup array that is built once per fit
+        if self._inverse is None:
+            self._inverse = self.categories.to_numpy(dtype=object)
+        return self._inverse[np.asarray(values, dtype=np.int64)]
+
+    def transform_sequences(self, column, count=False):
+        # Encode a column of per-case arrays with one transform over all events,
+        # with count=True the events are also added to the class counts
+        store = TraceStore.from_frame(column.to_frame(), [column.name])
+        store.map_flat(column.name, self.transform)
+        if count:
+            self.update_counts(store.sequences[column.name])
+        return store.to_frame()[column.name]
 
 
 class OneHotEmbedding(nn.Module):
+    # One-hot lookup where indices >= num_classes (or negative) are unknown and get the row of the rule,
+    # the table has num_classes + 1 rows and is built once, forward never modifies its input
     def __init__(self, num_classes, rule="zero", dist=None):
         super(OneHotEmbedding, self).__init__()
-        self.rule = rule  # 'zero', 'one_over_n', 'random', 'dummy'
+        self.rule = rule  # 'zero', 'one_over_n', 'random', 'dummy', 'dist'
         self.num_classes = num_classes
         self.dist = dist
 
-    def forward(self, x):
-        where = torch.where(x >= self.num_classes)
-        x[where] = torch.tensor(0, dtype=x.dtype)
-        one_hot = torch.nn.functional.one_hot(x, num_classes=self.num_classes).float()
-
-        if self.rule == 'dummy':
-            one_hot = torch.nn.functional.one_hot(x, num_classes=self.num_classes+1).float()
-            dummy_class = torch.zeros(self.num_classes+1)
-            dummy_class[-1] = 1
-            one_hot[where] = dummy_class
-        elif self.rule == 'zero':
-            one_hot[where] = torch.tensor(0., dtype=one_hot.dtype)
-        elif self.rule == 'one_over_n':
-            one_hot[where] = torch.tensor(1/self.num_classes, dtype=one_hot.dtype)
-        elif self.rule == 'random':
-            one_hot[where] = torch.rand(size=one_hot.shape)[where].clone().detach().type(one_hot.dtype)
-        elif self.rule == 'dist':
-            one_hot[where] = torch.tensor(self.dist, dtype=one_hot.dtype)
-        else:
+        width = num_classes + 1 if rule == "dummy" else num_classes
+        table = torch.zeros(num_classes + 1, width)
+        table[torch.arange(num_classes), torch.arange(num_classes)] = 1.
+        if rule == "dummy":
+            table[num_classes, num_classes] = 1.
+        elif rule == "one_over_n":
+            table[num_classes] = 1 / num_classes
+        elif rule == "dist":
+            # dist is the frequency vector over the classes, e.g. CustomLabelEncoder.distribution
+            dist = np.asarray(dist, dtype=np.float32).ravel()
+            if dist.shape[0] != num_classes:
+                raise ValueError(f"dist has {dist.shape[0]} entries, expected {num_classes}")
+            table[num_classes] = torch.from_numpy(dist)
+        elif rule not in ("zero", "random"):
             raise ValueError('Invalid rule')
+        self.register_buffer("table", table, persistent=False)
 
+    def forward(self, x):
+        unknown = (x < 0) | (x >= self.num_classes)
+        idx = torch.where(unknown, torch.full_like(x, self.num_classes), x).long()
+        one_hot = torch.nn.functional.embedding(idx, self.table)
+        if self.rule == "random":
+            # Fresh random rows only for the unknown positions
+            one_hot[unknown] = torch.rand(int(unknown.sum()), self.table.shape[1], device=one_hot.device)
         return one_hot
-
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 from src.Log import Reformat
+from src.Log.TraceStore import TraceStore
 from src.Preprocessing import Feature
 
 
@@ -12,11 +13,51 @@ def cal_lapse(time_stamp_arr):
     return -(time_stamp_arr[0] - time_stamp_arr).astype('timedelta64[s]').astype(int)
 
 
+def to_seconds(time_delta):
+    return time_delta.view('timedelta64[ns]').astype('timedelta64[s]').astype(int)
+
+
+def cal_time_targets(time_stamps, offsets):
+    # Time targets of all events of all cases in one pass, time_stamps is the flat array of all
+    # cases and offsets[i]:offsets[i+1] are the events of case i
+    time_ns = pd.to_datetime(pd.Series(time_stamps), utc=True).array.asi8
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    nonempty = lengths > 0
+    starts = offsets[:-1][nonempty]
+    ends = offsets[1:][nonempty] - 1
+
+    # Broadcast the first and last time stamp of each case to all of its events
+    first = np.repeat(time_ns[starts], lengths[nonempty])
+    last = np.repeat(time_ns[ends], lengths[nonempty])
+    previous = np.empty_like(time_ns)
+    previous[1:] = time_ns[:-1]
+    previous[starts] = time_ns[starts]
+    following = np.empty_like(time_ns)
+    following[:-1] = time_ns[1:]
+    following[ends] = time_ns[ends]
+
+    return {"RemTime": to_seconds(last - time_ns),
+            "LapseTime": -to_seconds(first - time_ns),
+            "ElapsedTime": to_seconds(time_ns - previous),
+            "NextTime": to_seconds(following - time_ns)}
+
+
+def add_time_targets(data_trace, time_column):
+    # Adds RemTime, LapseTime, ElapsedTime (since the previous event) and NextTime (until the next event)
+    store = TraceStore.from_frame(data_trace, [time_column])
+    targets = cal_time_targets(store.sequences[time_column], store.offsets)
+    target_trace = TraceStore(targets, store.offsets, pd.DataFrame(index=data_trace.index)).to_frame()
+    for column in targets:
+        data_trace[column] = target_trace[column]
+    return data_trace
+
+
 def custom_encoding(column):
     le = Feature.CustomLabelEncoder()
     le.fit(column)
-    le_name_mapping = dict(zip(le.classes_, le.transform(le.classes_)))
-    le_class_mapping = dict(zip(le.transform(le.classes_), le.classes_))
+    le_name_mapping = dict(zip(le.classes_, le.transform(le.classes_).tolist()))
+    le_class_mapping = dict(zip(le.transform(le.classes_).tolist(), le.classes_))
     return le.transform(column), le_name_mapping, le_class_mapping
 
 
@@ -42,22 +83,27 @@ def split_encode(trace, feature, train=0.64, val=0.16, random=False):
         values = np.concatenate([train_value, val_value, test_value])
         le = Feature.CustomLabelEncoder()
         le.fit(values)
-        name_mapping = dict(zip(le.classes_, le.transform(le.classes_)))
-        class_mapping = dict(zip(le.transform(le.classes_), le.classes_))
-        le_map[cat_feature] = {"name_mapping": name_mapping, "class_mapping": class_mapping}
-        train[cat_feature] = train[cat_feature].apply(le.transform).apply(np.array)
-        val[cat_feature] = val[cat_feature].apply(le.transform).apply(np.array)
-        test[cat_feature] = test[cat_feature].apply(le.transform).apply(np.array)
+        name_mapping = dict(zip(le.classes_, le.transform(le.classes_).tolist()))
+        class_mapping = dict(zip(le.transform(le.classes_).tolist(), le.classes_))
+        # The encoder keeps the class counts of the training events for the dist embedding
+        le_map[cat_feature] = {"name_mapping": name_mapping, "class_mapping": class_mapping, "encoder": le}
+        train[cat_feature] = le.transform_sequences(train[cat_feature], count=True)
+        val[cat_feature] = le.transform_sequences(val[cat_feature])
+        test[cat_feature] = le.transform_sequences(test[cat_feature])
 
     le_map_pd = pd.DataFrame(data=le_map)
     return train, val, test, le_map_pd
 
 
-def generate_dist_embedding(trace, features):
+def generate_dist_embedding(trace, features, encoders=None):
+    # With the le_map of split_encode as encoders the cached distribution of each encoder is used
     dist_embedding = {}
     for feature in features:
-        data = trace[feature].explode(feature).values
-        unique, counts = np.unique(data, return_counts=True)
-        frequencies = counts / counts.sum()
+        if encoders is not None:
+            frequencies = encoders[feature]["encoder"].distribution
+        else:
+            data = TraceStore.from_frame(trace[[feature]], [feature]).sequences[feature]
+            unique, counts = np.unique(data, return_counts=True)
+            frequencies = counts / counts.sum()
         dist_embedding[feature] = [frequencies]
     return pd.DataFrame(data=dist_embedding)
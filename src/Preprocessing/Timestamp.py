@@ -0,0 +1,36 @@
+import pandas as pd
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+
+def infer_format(column):
+    # Guess the format from the first non-null value, all ISO-8601 variants share pandas' ISO parser
+    sample = column.dropna()
+    if sample.shape[0] == 0:
+        return "ISO8601"
+    time_format = guess_datetime_format(str(sample.iloc[0]))
+    if time_format is None or time_format.startswith("%Y-%m-%d"):
+        return "ISO8601"
+    return time_format
+
+
+def normalize_timestamps(column, name=None, verbose=False):
+    # Parse a whole column in one vectorized pass into UTC datetime64[ns]
+    # Returns the parsed column and a boolean mask of rows that could not be parsed
+    if not isinstance(column, pd.Series):
+        column = pd.Series(column)
+    if isinstance(column.dtype, pd.DatetimeTZDtype):
+        parsed = column.dt.tz_convert("UTC")
+    elif pd.api.types.is_datetime64_dtype(column.dtype):
+        parsed = column.dt.tz_localize("UTC")
+    else:
+        parsed = pd.to_datetime(column, format=infer_format(column), utc=True, errors="coerce")
+    parsed = parsed.astype("datetime64[ns, UTC]")
+
+    invalid = parsed.isna() & column.notna()
+    if verbose and invalid.any():
+        print(f"{int(invalid.sum())} timestamp(s) in column {name or column.name} could not be parsed, "
+              f"first rows: {list(invalid.index[invalid.values][:5])}")
+    return parsed, invalid
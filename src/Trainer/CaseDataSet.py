@@ -1,13 +1,27 @@
+import os
+import json
+import shutil
+import hashlib
 import pandas as pd
 import numpy as np
 import torch
-from torch.nn import functional as F
 from torch.utils.data import Dataset
+from scipy import sparse
+from src.Log.TraceStore import TraceStore
+from src.Log.VariantIndex import VariantIndex
+
+
+# Attributes written to the meta.json of a prefix store
+PREFIX_STORE_META = ["feature_list", "label", "next_event_prediction", "encoding", "max_case_len", "onehot_size",
+                     "embedding_columns", "dense_columns", "weighted", "variant_columns", "label_id_column"]
+# Aggregate encodings and the running ufunc they are built from
+AGGREGATE_ENCODINGS = {"Agg_Mean": np.add, "Agg_Sum": np.add, "Agg_Min": np.minimum, "Agg_Max": np.maximum}
 
 
 class CaseDataset(Dataset):
     def __init__(self, data, feature_list=["Activity"], label="Next_Activity", encoding="all",
-                 max_case_len=1e4, min_case_len=1):
+                 max_case_len=1e4, min_case_len=1, weighted=False, embedding=False, label_ids=False, seed=None,
+                 record_shuffles=False):
 
         self.data_all = data
         self.feature_list = feature_list
@@ -23,55 +37,375 @@ class CaseDataset(Dataset):
         self.data_all = self.data_all[self.data_all["Case_Length"] > min_case_len]
         self.max_case_len = self.data_all["Case_Length"].max()
 
+        # Columns stored as integer codes (sparse one-hot encoding), expanded through a lookup table
+        self.onehot_size = dict(data.attrs.get("onehot_size", {}))
+        self.onehot_table = {column: np.eye(size) for column, size in self.onehot_size.items()}
+        # In embedding mode code columns are returned as int32 indices for the model's nn.Embedding
+        self.embedding_columns = []
+        if embedding:
+            if encoding != "all":
+                raise ValueError("Embedding input requires the 'all' encoding")
+            self.embedding_columns = [column for column in self.feature_list if column in self.onehot_size]
+        self.dense_columns = [column for column in self.feature_list if column not in self.embedding_columns]
+
         self.prefix_length = 1
+
+        # Cases with identical feature and label sequences are kept once and weighted by their count
+        self.weighted = weighted
+        self.variant_columns = list(dict.fromkeys(self.feature_list + [self.label]))
+        if self.weighted:
+            variant_index = VariantIndex(self.data_all, self.variant_columns)
+            self.data_all = variant_index.compress(self.data_all)
+
+        # Prefix index: every sequence column is one flat array over all events and a sample
+        # (case, prefix length) is gathered from the case offsets, so no call touches the whole table
+        self.store = TraceStore.from_frame(self.data_all, self.variant_columns)
+        self.starts = self.store.offsets[:-1]
+        # Number of (weighted) cases every stored case stands for
+        self.case_weights = np.ones(self.store.num_cases)
+        if self.weighted:
+            self.case_weights = self.data_all["Weight"].values.astype(np.float64)
+        # With label_ids a categorical label is returned as int64 class ids instead of one-hot rows
+        self.label_id_column = None
+        if label_ids:
+            if self.label in self.onehot_size:
+                self.label_id_column = self.label
+            elif self.store.sequences[self.label].ndim == 2:
+                self.store.sequences["Label_Id"] = self.store.sequences[self.label].argmax(axis=-1)
+                self.label_id_column = "Label_Id"
+            elif np.issubdtype(self.store.sequences[self.label].dtype, np.integer):
+                # Label encoded column, the values already are the class ids
+                self.store.sequences["Label_Id"] = self.store.sequences[self.label].astype(np.int64)
+                self.label_id_column = "Label_Id"
+            else:
+                raise ValueError(f"Label {self.label} is neither one-hot nor label encoded")
         for column in self.feature_list:
-            if self.data_all[column].values[0].ndim == 1:
-                self.data_all[column] = self.data_all[column].apply(lambda x: x.reshape((-1, 1)))
-        self.data_pool = self.data_all.copy()
+            if column not in self.onehot_size and self.store.sequences[column].ndim == 1:
+                self.store.sequences[column] = self.store.sequences[column].reshape((-1, 1))
+
+        self.order = np.arange(self.store.num_cases)  # Current (shuffled) order of the cases
+        # Shuffles only permute the case index, drawn from a seeded generator so runs can be repeated
+        self.rng = np.random.default_rng(seed)
+        self.shuffle_log = [] if record_shuffles else None  # Case order after every shuffle
+        self.sample_pool = {}  # max_prefix -> (cases, weights) of the samples in the current order
+        self.variant_pool = {}  # max_prefix -> (cases, weights) of the merged variants
+        self.aggregate_pool = {}  # Column -> aggregate of every prefix, one row per last event of the prefix
 
     def set_prefix_length(self, prefix_len):
         self.prefix_length = prefix_len
 
     def shuffle_data(self):
-        self.data_pool = self.data_pool.sample(frac=1)
+        self.order = self.order[self.rng.permutation(self.order.shape[0])]
+        self.sample_pool = {}
+        if self.shuffle_log is not None:
+            self.shuffle_log.append(self.order)
 
-    def update_data_pool(self):
-        max_prefix = self.prefix_length
+    def get_max_prefix(self):
         if self.next_event_prediction:
-            max_prefix = self.prefix_length + 1
-        data_temp = self.data_pool[self.data_pool["Case_Length"] >= max_prefix]
-        return data_temp
+            return self.prefix_length + 1
+        return self.prefix_length
 
-    def convert_feature_vec(self, data):
-        data_com = np.hstack(data.values)
-        if self.encoding == "Last":
-            return data_com[self.prefix_length-1]
-        if self.encoding == "Agg_Mean":
-            return np.mean(data_com[:self.prefix_length], axis=0)
-        return torch.from_numpy(data_com[:self.prefix_length])
-
-    def convert_label_vec(self, label):
-        if label.shape[0] == 1:
-            return torch.from_numpy(label[0])
-        if self.next_event_prediction:
-            return torch.from_numpy(label[self.prefix_length:self.prefix_length+1])
-        else:
-            return torch.from_numpy(label[self.prefix_length-1:self.prefix_length])
+    def get_samples(self):
+        # Cases of all samples of the current prefix length in the current order, with their weights
+        max_prefix = self.get_max_prefix()
+        if max_prefix not in self.sample_pool:
+            if self.weighted:
+                cases, weights = self.get_variants(max_prefix)
+                rank = np.empty_like(self.order)
+                rank[self.order] = np.arange(self.order.shape[0])
+                sort_idx = np.argsort(rank[cases], kind="stable")
+                self.sample_pool[max_prefix] = (cases[sort_idx], weights[sort_idx])
+            else:
+                cases = self.order[self.store.lengths[self.order] >= max_prefix]
+                self.sample_pool[max_prefix] = (cases, None)
+        return self.sample_pool[max_prefix]
 
-    def __len__(self):
-        data_temp = self.update_data_pool()
-        return data_temp.shape[0]
+    def get_variants(self, max_prefix):
+        # Merge variants that share the same (prefix, label) sample at this prefix length
+        if max_prefix not in self.variant_pool and self.data_all is None:
+            # Loaded from a prefix store, all prefix lengths with samples are already in the pool
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if max_prefix not in self.variant_pool:
+            cases = np.flatnonzero(self.store.lengths >= max_prefix)
+            data_temp = self.data_all.iloc[cases]
+            slices = []
+            for column in self.variant_columns:
+                if column not in self.feature_list:
+                    slices.append(slice(max_prefix - 1, max_prefix))
+                elif column == self.label:
+                    slices.append(slice(0, max_prefix))
+                else:
+                    slices.append(slice(0, self.prefix_length))
+            variant_index = VariantIndex(data_temp, self.variant_columns, slices, data_temp["Weight"].values)
+            self.variant_pool[max_prefix] = (cases[variant_index.representatives], variant_index.counts)
+        return self.variant_pool[max_prefix]
 
-    def __getitem__(self, idx):
-        data_temp = self.update_data_pool()
+    def sample_index(self):
+        # Cases, prefix lengths and weights of the samples of all prefix lengths
+        prefix_length = self.prefix_length
+        cases, prefix_lens, weights = [], [], []
+        for prefix_len in range(1, int(self.max_case_len) + 1):
+            self.set_prefix_length(prefix_len)
+            prefix_cases, prefix_weights = self.get_samples()
+            if prefix_cases.shape[0] == 0:
+                break
+            cases.append(prefix_cases)
+            prefix_lens.append(np.full(prefix_cases.shape[0], prefix_len))
+            weights.append(np.ones(prefix_cases.shape[0]) if prefix_weights is None else prefix_weights)
+        self.set_prefix_length(prefix_length)
+        if not cases:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(cases), np.concatenate(prefix_lens), np.concatenate(weights)
+
+    def prefix_store_meta(self):
+        # Settings of the data set plus a fingerprint of its arrays, an existing store is only reused
+        # when its meta.json is equal
+        meta = {name: getattr(self, name) for name in PREFIX_STORE_META}
+        meta["max_case_len"] = int(meta["max_case_len"])
+        meta["columns"] = list(self.store.sequences.keys())
+        digest = hashlib.blake2b(digest_size=16)
+        for values in [self.store.offsets, self.case_weights] + [self.store.sequences[c] for c in meta["columns"]]:
+            values = np.ascontiguousarray(values)
+            digest.update(f"{values.dtype.str}{values.shape}".encode())
+            digest.update(values.tobytes())
+        meta["fingerprint"] = digest.hexdigest()
+        return json.loads(json.dumps(meta))
+
+    def save_prefix_store(self, path):
+        # Write the flat event arrays and the sample index to path (a directory of .npy files) and read
+        # them back memory-mapped. Each sample is the slice offsets[i]:offsets[i] + lengths[i] of the
+        # flat arrays, its label is the matching event of the label column
+        meta = self.prefix_store_meta()
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp-{os.getpid()}"
+            os.makedirs(tmp_path)
+            for column, values in self.store.sequences.items():
+                if values.dtype == object:
+                    raise ValueError(f"Column {column} has no numeric dtype and cannot be memory-mapped")
+                np.save(os.path.join(tmp_path, f"seq_{column}.npy"), values)
+            np.save(os.path.join(tmp_path, "offsets.npy"), self.store.offsets)
+            cases, prefix_lens, weights = self.sample_index()
+            np.save(os.path.join(tmp_path, "sample_cases.npy"), cases)
+            np.save(os.path.join(tmp_path, "sample_offsets.npy"), self.starts[cases])
+            np.save(os.path.join(tmp_path, "sample_lengths.npy"), prefix_lens)
+            np.save(os.path.join(tmp_path, "sample_weights.npy"), weights)
+            np.save(os.path.join(tmp_path, "case_weights.npy"), self.case_weights)
+            with open(os.path.join(tmp_path, "meta.json"), "w") as file:
+                json.dump(meta, file)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Another process wrote the same store first
+                shutil.rmtree(tmp_path)
+        with open(os.path.join(path, "meta.json"), "r") as file:
+            if json.load(file) != meta:
+                raise ValueError(f"{path} already holds a prefix store of a different data set")
+        return self.load_prefix_store(path, self)
+
+    @classmethod
+    def load_prefix_store(cls, path, dataset=None, seed=None):
+        # Read-only memory-mapped data set, processes opening the same store share it through the page cache
+        with open(os.path.join(path, "meta.json"), "r") as file:
+            meta = json.load(file)
+        if dataset is None:
+            dataset = cls.__new__(cls)
+            for name in PREFIX_STORE_META:
+                setattr(dataset, name, meta[name])
+            dataset.onehot_table = {column: np.eye(size) for column, size in dataset.onehot_size.items()}
+            dataset.prefix_length = 1
+            dataset.data_all = None
+            dataset.rng = np.random.default_rng(seed)
+            dataset.shuffle_log = None
+        sequences = {column: np.load(os.path.join(path, f"seq_{column}.npy"), mmap_mode="r")
+                     for column in meta["columns"]}
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        dataset.store = TraceStore(sequences, offsets)
+        dataset.starts = dataset.store.offsets[:-1]
+        dataset.case_weights = np.load(os.path.join(path, "case_weights.npy"))
+        dataset.order = np.arange(dataset.store.num_cases)
+        dataset.sample_pool = {}
+        dataset.variant_pool = {}
+        dataset.aggregate_pool = {}
+        if dataset.weighted:
+            cases = np.load(os.path.join(path, "sample_cases.npy"))
+            prefix_lens = np.load(os.path.join(path, "sample_lengths.npy"))
+            weights = np.load(os.path.join(path, "sample_weights.npy"))
+            shift = 1 if dataset.next_event_prediction else 0
+            for prefix_len in np.unique(prefix_lens):
+                in_prefix = prefix_lens == prefix_len
+                dataset.variant_pool[int(prefix_len) + shift] = (cases[in_prefix], weights[in_prefix])
+        return dataset
+
+    def select_samples(self, idx):
+        cases, weights = self.get_samples()
         if torch.is_tensor(idx):
             idx = idx.tolist()
+        if weights is None:
+            return np.atleast_1d(cases[idx]), None
+        return np.atleast_1d(cases[idx]), np.atleast_1d(weights[idx])
+
+    def get_weight(self, idx=slice(None)):
+        # Sample weights aligned with self[idx], all ones for an unweighted data set
+        cases, weights = self.select_samples(idx)
+        if weights is None:
+            return torch.ones(cases.shape[0])
+        return torch.from_numpy(weights.astype(np.float32))
+
+    def gather(self, column, event_idx):
+        values = self.store.sequences[column][event_idx]
+        if column in self.onehot_size:
+            return self.onehot_table[column][values]
+        return values
+
+    def aggregate(self, column):
+        # Running aggregates over the flat event arrays, computed once for all prefixes in O(events).
+        # Code columns become sparse category counts, the aggregates of a one-hot column
+        if column not in self.aggregate_pool:
+            prefix_len = self.store.position() + 1
+            if column in self.onehot_size:
+                values = self.store.accumulate_counts(column, self.onehot_size[column])
+                if self.encoding == "Agg_Mean":
+                    values = sparse.diags(1 / prefix_len) @ values
+                elif self.encoding == "Agg_Max":
+                    values.data = np.ones_like(values.data)
+                elif self.encoding == "Agg_Min":
+                    values.data = (values.data == np.repeat(prefix_len, np.diff(values.indptr))).astype(np.float64)
+                    values.eliminate_zeros()
+                # XGBoost misreads CSR input whose column indices are not sorted within a row
+                values = values.tocsr()
+                values.sort_indices()
+            else:
+                values = self.store.accumulate(column, AGGREGATE_ENCODINGS[self.encoding])
+                if self.encoding == "Agg_Mean":
+                    values = values / prefix_len.reshape((-1,) + (1,) * (values.ndim - 1))
+            self.aggregate_pool[column] = values
+        return self.aggregate_pool[column]
+
+    def get_features(self, cases, columns, prefix_len=None):
+        # (samples, prefix, width) for the 'all' encoding, (samples, width) for Last and the aggregate encodings
+        prefix_len = prefix_len or self.prefix_length
+        if self.encoding in AGGREGATE_ENCODINGS:
+            event_idx = self.starts[cases] + prefix_len - 1
+            data_com = [self.aggregate(column)[event_idx] for column in columns]
+            data_com = [values.toarray() if sparse.issparse(values) else values for values in data_com]
+            return torch.from_numpy(np.concatenate(data_com, axis=-1))
+        if self.encoding == "Last":
+            event_idx = self.starts[cases] + prefix_len - 1
+        else:
+            event_idx = self.starts[cases][:, None] + np.arange(prefix_len)
+        data_com = np.concatenate([self.gather(column, event_idx) for column in columns], axis=-1)
+        return torch.from_numpy(data_com)
+
+    def get_codes(self, cases, prefix_len=None):
+        prefix_len = prefix_len or self.prefix_length
+        event_idx = self.starts[cases][:, None] + np.arange(prefix_len)
+        codes = [self.store.sequences[column][event_idx] for column in self.embedding_columns]
+        return torch.from_numpy(np.stack(codes, axis=-1).astype(np.int32))
+
+    def get_labels(self, cases, prefix_len=None):
+        prefix_len = prefix_len or self.prefix_length
+        event_idx = self.starts[cases][:, None] + (prefix_len if self.next_event_prediction else prefix_len - 1)
+        if self.label_id_column is not None:
+            return torch.from_numpy(self.store.sequences[self.label_id_column][event_idx].astype(np.int64))
+        return torch.from_numpy(self.gather(self.label, event_idx))
+
+    def embedding_sizes(self):
+        return [self.onehot_size[column] for column in self.embedding_columns]
 
-        x = data_temp[self.feature_list].apply(self.convert_feature_vec, axis=1).values[idx]
-        y = data_temp[self.label].apply(self.convert_label_vec).values[idx]
+    def num_classes(self):
+        # Width of the one-hot label, also when the data set emits class ids. Label encoded labels
+        # count up to their largest class id
+        if self.label in self.onehot_size:
+            return self.onehot_size[self.label]
+        values = self.store.sequences[self.label]
+        if values.ndim == 2 and not (self.label in self.feature_list and values.shape[-1] == 1):
+            return values.shape[-1]
+        if np.issubdtype(values.dtype, np.integer):
+            return int(values.max(initial=-1)) + 1
+        raise ValueError(f"Label {self.label} is neither one-hot nor label encoded")
 
-        if len(x) == 0:
+    def use_sparse_features(self):
+        return len(self.onehot_size) > 0 and (self.encoding == "Last" or self.encoding in AGGREGATE_ENCODINGS)
+
+    def get_sparse_features(self):
+        # CSR feature matrix of the current prefix length, code columns are never densified
+        cases, _ = self.get_samples()
+        num_rows = cases.shape[0]
+        blocks = []
+        for column in self.feature_list:
+            if column not in self.onehot_size:
+                blocks.append(sparse.csr_matrix(self.get_features(cases, [column]).numpy()))
+                continue
+            if self.encoding in AGGREGATE_ENCODINGS:
+                blocks.append(self.aggregate(column)[self.starts[cases] + self.prefix_length - 1])
+                continue
+            codes = self.store.sequences[column][self.starts[cases] + self.prefix_length - 1]
+            blocks.append(sparse.csr_matrix((np.ones(num_rows), (np.arange(num_rows), codes)),
+                                            shape=(num_rows, self.onehot_size[column])))
+        return sparse.hstack(blocks, format="csr")
+
+    def get_label(self, idx=slice(None)):
+        cases, _ = self.select_samples(idx)
+        return self.get_labels(cases)
+
+    def get_batch(self, cases, prefix_len):
+        # Samples of the given cases at one prefix length, independent of set_prefix_length
+        if self.embedding_columns:
+            if self.dense_columns:
+                continuous = self.get_features(cases, self.dense_columns, prefix_len)
+            else:
+                continuous = torch.zeros((cases.shape[0], prefix_len, 0), dtype=torch.float64)
+            # x is a (codes, continuous) pair: int32 (cases, prefix, code columns) and the other features
+            x = (self.get_codes(cases, prefix_len), continuous)
+        else:
+            x = self.get_features(cases, self.feature_list, prefix_len)
+        return x, self.get_labels(cases, prefix_len)
+
+    def get_sequences(self, cases):
+        # Whole cases for sequence-to-sequence training: step t of x is the last event of the prefix of
+        # length t + 1 and y[:, t] its label. Cases are right-padded by repeating their last event,
+        # mask marks the steps that are real samples and weights holds one weight per case
+        shift = 1 if self.next_event_prediction else 0
+        lengths = self.store.lengths[cases]
+        num_prefixes = np.maximum(lengths - shift, 0)
+        steps = np.arange(max(int(num_prefixes.max(initial=0)), 1))
+        last_event = (self.starts[cases] + lengths - 1)[:, None]
+        event_idx = np.minimum(self.starts[cases][:, None] + steps, last_event)
+        label_idx = np.minimum(event_idx + shift, last_event)
+        mask = torch.from_numpy(steps[None, :] < num_prefixes[:, None])
+
+        if self.embedding_columns:
+            codes = [self.store.sequences[column][event_idx] for column in self.embedding_columns]
+            if self.dense_columns:
+                continuous = torch.from_numpy(np.concatenate([self.gather(column, event_idx)
+                                                              for column in self.dense_columns], axis=-1))
+            else:
+                continuous = torch.zeros(event_idx.shape + (0,), dtype=torch.float64)
+            x = (torch.from_numpy(np.stack(codes, axis=-1).astype(np.int32)), continuous)
+        else:
+            x = torch.from_numpy(np.concatenate([self.gather(column, event_idx) for column in self.feature_list],
+                                                axis=-1))
+        if self.label_id_column is not None:
+            y = torch.from_numpy(self.store.sequences[self.label_id_column][label_idx].astype(np.int64))
+        else:
+            y = torch.from_numpy(self.gather(self.label, label_idx))
+
+        # Merging variants per prefix length gives the same weighted loss as weighting every case
+        weights = self.case_weights[cases]
+        return x, y, mask, torch.from_numpy(weights.astype(np.float32))
+
+    def __len__(self):
+        return self.get_samples()[0].shape[0]
+
+    def __getitem__(self, idx):
+        # Cost is O(samples in idx), a single integer index returns one sample without batch axis
+        cases, _ = self.select_samples(idx)
+        if cases.shape[0] == 0:
             return None
+        x, y = self.get_batch(cases, self.prefix_length)
 
-        y = torch.stack(y.tolist())
-        return torch.tensor(np.stack(x)), y
\ No newline at end of file
+        if isinstance(idx, (int, np.integer)):
+            if isinstance(x, tuple):
+                return (x[0][0], x[1][0]), y[0]
+            return x[0], y[0]
+        return x, y
@@ -0,0 +1,146 @@
+import numpy as np
+import torch
+from torch.utils.data import Dataset, IterableDataset, Sampler, DataLoader, get_worker_info
+
+
+class PrefixDataset(Dataset):
+    # Flat view on all (case, prefix length) samples of a CaseDataset, item i does not depend on
+    # the prefix length the CaseDataset is currently set to, so it can be read from worker processes
+    def __init__(self, case_dataset):
+        self.case_dataset = case_dataset
+        self.cases, self.prefix_lens, self.weights = case_dataset.sample_index()
+
+    def __len__(self):
+        return self.cases.shape[0]
+
+    def __getitem__(self, idx):
+        x, y = self.case_dataset.get_batch(self.cases[idx:idx + 1], int(self.prefix_lens[idx]))
+        if isinstance(x, tuple):
+            x = (x[0][0], x[1][0])
+        else:
+            x = x[0]
+        return x, y[0], torch.tensor(self.weights[idx], dtype=torch.float32)
+
+
+class PrefixStream(IterableDataset):
+    # Walks the cases of a CaseDataset and yields their prefix samples one by one, only shuffle_buffer
+    # samples are held at a time. Each DataLoader worker takes every num_workers-th case
+    def __init__(self, case_dataset, shuffle_buffer=1024, seed=None):
+        self.case_dataset = case_dataset
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+        # Stored with the prefix store, so loaded weighted data sets keep their objective
+        self.case_weights = case_dataset.case_weights
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        shift = 1 if self.case_dataset.next_event_prediction else 0
+        return int(np.sum(np.maximum(self.case_dataset.store.lengths - shift, 0)))
+
+    def generate_samples(self, cases):
+        shift = 1 if self.case_dataset.next_event_prediction else 0
+        for case in cases:
+            for prefix_len in range(1, int(self.case_dataset.store.lengths[case]) - shift + 1):
+                x, y = self.case_dataset.get_batch(np.array([case]), prefix_len)
+                if isinstance(x, tuple):
+                    x = (x[0][0], x[1][0])
+                else:
+                    x = x[0]
+                yield x, y[0], torch.tensor(self.case_weights[case], dtype=torch.float32)
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = 0, 1
+        if worker_info is not None:
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+        seed = None if self.seed is None else [self.seed, self.epoch, worker_id]
+        rng = np.random.default_rng(seed)
+        cases = np.arange(self.case_dataset.store.num_cases)[worker_id::num_workers]
+        if self.shuffle_buffer <= 1:
+            yield from self.generate_samples(cases)
+            return
+        buffer = []
+        for sample in self.generate_samples(rng.permutation(cases)):
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            pos = rng.integers(len(buffer))
+            buffer[pos], sample = sample, buffer[pos]
+            yield sample
+        for pos in rng.permutation(len(buffer)):
+            yield buffer[pos]
+
+
+class PrefixBatchSampler(Sampler):
+    # Batches only contain samples whose prefix lengths fall into the same bucket of bucket_width lengths,
+    # with bucket_width=1 every batch has a single prefix length and needs no padding
+    def __init__(self, prefix_lens, batch_size, bucket_width=1, shuffle=True, drop_last=False, seed=None):
+        self.buckets = (np.asarray(prefix_lens) - 1) // bucket_width
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.rng = np.random.default_rng(seed)
+
+    def __iter__(self):
+        batches = []
+        for bucket in np.unique(self.buckets):
+            ids = np.flatnonzero(self.buckets == bucket)
+            if self.shuffle:
+                ids = self.rng.permutation(ids)
+            for start in range(0, ids.shape[0], self.batch_size):
+                batch = ids[start:start + self.batch_size]
+                if self.drop_last and batch.shape[0] < self.batch_size:
+                    continue
+                batches.append(batch.tolist())
+        if self.shuffle:
+            batches = [batches[i] for i in self.rng.permutation(len(batches))]
+        return iter(batches)
+
+    def __len__(self):
+        _, sizes = np.unique(self.buckets, return_counts=True)
+        if self.drop_last:
+            return int(np.sum(sizes // self.batch_size))
+        return int(np.sum(-(-sizes // self.batch_size)))
+
+
+def pad_right(tensors):
+    # Shorter prefixes are padded with zeros behind their last event, the LSTM packs the batch with
+    # the prefix lengths so padded steps are never run
+    length = max(tensor.shape[0] for tensor in tensors)
+    padded = tensors[0].new_zeros((len(tensors), length) + tuple(tensors[0].shape[1:]))
+    for i, tensor in enumerate(tensors):
+        padded[i, :tensor.shape[0]] = tensor
+    return padded
+
+
+def collate_prefix(samples):
+    # Batches are (x, y, weights, lengths), lengths is None when all prefixes have the same length
+    xs, ys, weights = zip(*samples)
+    lengths = torch.tensor([(x[0] if isinstance(x, tuple) else x).shape[0] for x in xs])
+    if isinstance(xs[0], tuple):
+        x = (pad_right([x[0] for x in xs]), pad_right([x[1] for x in xs]))
+    else:
+        x = pad_right(xs)
+    if lengths.min() == lengths.max():
+        lengths = None
+    return x, torch.stack(ys), torch.stack(weights), lengths
+
+
+def prefix_loader(case_dataset, batch_size, shuffle=True, bucket_width=1, num_workers=0, pin_memory=False,
+                  prefetch_factor=None, seed=None, shuffle_buffer=None):
+    # DataLoader over all prefix samples of a CaseDataset, batches are (x, y, weights, lengths)
+    # With shuffle_buffer the samples are streamed by a PrefixStream instead of indexed up front
+    if num_workers == 0:
+        prefetch_factor = None
+    if shuffle_buffer is not None:
+        dataset = PrefixStream(case_dataset, shuffle_buffer if shuffle else 0, seed)
+        return DataLoader(dataset, batch_size=batch_size, collate_fn=collate_prefix, num_workers=num_workers,
+                          pin_memory=pin_memory, prefetch_factor=prefetch_factor)
+    dataset = PrefixDataset(case_dataset)
+    sampler = PrefixBatchSampler(dataset.prefix_lens, batch_size, bucket_width, shuffle, seed=seed)
+    return DataLoader(dataset, batch_sampler=sampler, collate_fn=collate_prefix, num_workers=num_workers,
+                      pin_memory=pin_memory, prefetch_factor=prefetch_factor,
+                      persistent_workers=num_workers > 0)
@@ -7,6 +7,8 @@ from joblib import dump, load
 import importlib
 import torch
 from src.Model import DLModels
+from src.Trainer import PrefixLoader
+from src.Trainer import TrainUtil
 
 
 class XgbRegressor():
@@ -24,21 +26,31 @@ class XgbRegressor():
     def generate_data_set(self, dataset):
         feature_list = []
         label_list = []
+        weight_list = []
         for prefix_len in range(1, dataset.max_case_len+1):
             dataset.set_prefix_length(prefix_len)
-            if dataset:
+            if not dataset:
+                break
+            if dataset.use_sparse_features():
+                feature_list.append(dataset.get_sparse_features())
+                label_list.append(dataset.get_label().numpy())
+            else:
                 feature_list.append(dataset[:][0].numpy())
                 label_list.append(dataset[:][1].numpy())
-            else:
-                break
-        return [np.vstack(feature_list), np.vstack(label_list)]
+            weight_list.append(dataset.get_weight().numpy())
+        weights = np.hstack(weight_list) if dataset.weighted else None
+        return [TrainUtil.vstack_features(feature_list), np.vstack(label_list), weights]
 
     def train(self):
-        self.reg.fit(self.train_input[0], self.train_input[1],
-                     eval_set=[(self.val_input[0], self.val_input[1])], verbose=False)
+        sample_weight_eval_set = None
+        if self.val_input[2] is not None:
+            sample_weight_eval_set = [self.val_input[2]]
+        self.reg.fit(self.train_input[0], self.train_input[1], sample_weight=self.train_input[2],
+                     eval_set=[(self.val_input[0], self.val_input[1])],
+                     sample_weight_eval_set=sample_weight_eval_set, verbose=False)
 
     def score(self):
-        return self.reg.score(self.val_input[0], self.val_input[1])
+        return self.reg.score(self.val_input[0], self.val_input[1], sample_weight=self.val_input[2])
 
     def predict(self, test_set):
         test_input = self.generate_data_set(test_set)
@@ -60,31 +72,46 @@ def train_model_epoch(model, training_set, optimizer, criterion, torch_device, b
         input_data = training_data_set[:]
         if input_data is None:
             break
-        sample_num = input_data[0].shape[0]
-        sample_num_list.append(sample_num)
+        sample_num = TrainUtil.num_samples(input_data[0])
+        weights = None
+        if training_data_set.weighted:
+            weights = training_data_set.get_weight().to(torch_device)
+        sample_num_list.append(sample_num if weights is None else weights.sum().item())
 
         batch_num = int(sample_num / batch_size)
         for i in range(batch_num):
-            x = input_data[0][int(batch_size * i): int(batch_size * (i+1))].float().to(torch_device)
+            x = TrainUtil.batch_input(input_data[0], int(batch_size * i), int(batch_size * (i+1)), torch_device)
             y = input_data[1][int(batch_size * i): int(batch_size * (i+1))].float().to(torch_device)
             outputs = model(x)
-            loss = criterion(outputs, y)
+            if weights is None:
+                loss = criterion(outputs, y)
+                batch_weight = TrainUtil.num_samples(x)
+            else:
+                w = weights[int(batch_size * i): int(batch_size * (i+1))]
+                loss = TrainUtil.weighted_loss(criterion, outputs, y, w)
+                batch_weight = w.sum().item()
             if training:
                 optimizer.zero_grad()
                 loss.backward()
                 optimizer.step()
-            loss_prefix = loss_prefix + loss.item() * x.shape[0]
+            loss_prefix = loss_prefix + loss.item() * batch_weight
 
         if sample_num > batch_size * batch_num:
-            x = input_data[0][batch_size * batch_num:].float().to(torch_device)
+            x = TrainUtil.batch_input(input_data[0], batch_size * batch_num, None, torch_device)
             y = input_data[1][batch_size * batch_num:].float().to(torch_device)
             outputs = model(x)
-            loss = criterion(outputs, y)
+            if weights is None:
+                loss = criterion(outputs, y)
+                batch_weight = TrainUtil.num_samples(x)
+            else:
+                w = weights[batch_size * batch_num:]
+                loss = TrainUtil.weighted_loss(criterion, outputs, y, w)
+                batch_weight = w.sum().item()
             if training:
                 optimizer.zero_grad()
                 loss.backward()
                 optimizer.step()
-            loss_prefix = loss_prefix + loss.item()* x.shape[0]
+            loss_prefix = loss_prefix + loss.item() * batch_weight
 
         loss_prefix_list.append(loss_prefix)
     return np.array(loss_prefix_list), np.array(sample_num_list)
@@ -92,24 +119,48 @@ def train_model_epoch(model, training_set, optimizer, criterion, torch_device, b
 
 def train_model(model, optimizer, criterion, training_set,
                 test_set, batch_size, torch_device, device_package,
-                max_epoch=100, max_ob_iter=20, score_margin=1e-4, print_iter=False):
+                max_epoch=100, max_ob_iter=20, score_margin=1e-4, print_iter=False, loader_config=None,
+                seq2seq=False):
+    # With loader_config (keyword arguments of prefix_loader) the epochs run over DataLoaders,
+    # with seq2seq every case is run once and trained on all of its prefixes
     train_score_list = []
     test_score_list = []
+    if loader_config is not None:
+        train_loader = PrefixLoader.prefix_loader(training_set, batch_size, shuffle=True, **loader_config)
+        test_loader = PrefixLoader.prefix_loader(test_set, batch_size, shuffle=False, **loader_config)
     score = 1e5
     best_iter = 0
     best_model = None
     for iter_epoch in range(max_epoch):
         device_package.empty_cache()
-        loss_train, sample_num_train = train_model_epoch(model, training_set, batch_size=batch_size,
-                                                         optimizer=optimizer,
-                                                         criterion=criterion,
-                                                         torch_device=torch_device)
-        device_package.empty_cache()
-        loss_test, sample_num_test = train_model_epoch(model, test_set, batch_size=batch_size,
-                                                       optimizer=optimizer,
-                                                       criterion=criterion,
-                                                       torch_device=torch_device,
-                                                       training=False)
+        if seq2seq:
+            loss_train, sample_num_train = TrainUtil.train_sequence_epoch(model, training_set, optimizer, criterion,
+                                                                          torch_device, TrainUtil.value_target,
+                                                                          batch_size)
+            device_package.empty_cache()
+            loss_test, sample_num_test = TrainUtil.train_sequence_epoch(model, test_set, optimizer, criterion,
+                                                                        torch_device, TrainUtil.value_target,
+                                                                        batch_size, training=False)
+        elif loader_config is not None:
+            if isinstance(train_loader.dataset, PrefixLoader.PrefixStream):
+                train_loader.dataset.set_epoch(iter_epoch)
+            loss_train, sample_num_train = TrainUtil.train_loader_epoch(model, train_loader, optimizer, criterion,
+                                                                        torch_device, TrainUtil.value_target)
+            device_package.empty_cache()
+            loss_test, sample_num_test = TrainUtil.train_loader_epoch(model, test_loader, optimizer, criterion,
+                                                                      torch_device, TrainUtil.value_target,
+                                                                      training=False)
+        else:
+            loss_train, sample_num_train = train_model_epoch(model, training_set, batch_size=batch_size,
+                                                             optimizer=optimizer,
+                                                             criterion=criterion,
+                                                             torch_device=torch_device)
+            device_package.empty_cache()
+            loss_test, sample_num_test = train_model_epoch(model, test_set, batch_size=batch_size,
+                                                           optimizer=optimizer,
+                                                           criterion=criterion,
+                                                           torch_device=torch_device,
+                                                           training=False)
 
         score_train = np.sum(loss_train) / np.sum(sample_num_train)
         score_test = np.sum(loss_test) / np.sum(sample_num_test)
@@ -141,14 +192,14 @@ def evaluate_model(model, test_set, torch_device, device_package, batch_size=100
         if input_data is None:
             # print("Max length reached, abort")
             break
-        sample_num = input_data[0].shape[0]
+        sample_num = TrainUtil.num_samples(input_data[0])
         sample_num_list.append(sample_num)
 
         output_list = []
         label_list = []
         batch_num = int(sample_num / batch_size)
         for i in range(batch_num):
-            x = input_data[0][int(batch_size * i): int(batch_size * (i+1))].float().to(torch_device)
+            x = TrainUtil.batch_input(input_data[0], int(batch_size * i), int(batch_size * (i+1)), torch_device)
             y = input_data[1][int(batch_size * i): int(batch_size * (i+1))].float()
             outputs = model(x).detach()
             output_list.append(outputs.cpu().numpy())
@@ -157,7 +208,7 @@ def evaluate_model(model, test_set, torch_device, device_package, batch_size=100
             device_package.empty_cache()
 
         if sample_num > batch_size * batch_num:
-            x = input_data[0][batch_size * batch_num:].float().to(torch_device)
+            x = TrainUtil.batch_input(input_data[0], batch_size * batch_num, None, torch_device)
             y = input_data[1][batch_size * batch_num:].float()
             outputs = model(x).detach()
             output_list.append(outputs.cpu().numpy())
@@ -172,21 +223,27 @@ def evaluate_model(model, test_set, torch_device, device_package, batch_size=100
 
 
 class LstmRegressor():
-    def __init__(self, training_set, validation_set, hidden_size, num_layers, optimizer, loss, batch_size, max_epoch=200, max_ob_iter=40):
+    def __init__(self, training_set, validation_set, hidden_size, num_layers, optimizer, loss, batch_size, max_epoch=200, max_ob_iter=40,
+                 embedding_dim=16, loader_config=None, seq2seq=False):
         self.torch_device = "cpu"
         self.device_package = torch.cpu
         self.check_torch_device()
         self.training_set = training_set
         self.validation_set = validation_set
-        self.input_size = self.training_set[:][0].shape[-1]
+        # Only the continuous features count here when the data set feeds embedding codes
+        x = self.training_set[:][0]
+        self.input_size = x[1].shape[-1] if isinstance(x, tuple) else x.shape[-1]
         self.hidden_size = hidden_size
         self.num_layers = num_layers
-        self.model = DLModels.SimpleLSTM(self.input_size, self.hidden_size, self.num_layers, 1).to(self.torch_device)
+        self.model = DLModels.SimpleLSTM(self.input_size, self.hidden_size, self.num_layers, 1,
+                                         self.training_set.embedding_sizes(), embedding_dim).to(self.torch_device)
         self.optimizer = optimizer(self.model.parameters(), lr=1e-3)
         self.loss = loss
         self.batch_size = batch_size
         self.max_epoch = max_epoch
         self.max_ob_iter = max_ob_iter
+        self.loader_config = loader_config
+        self.seq2seq = seq2seq
         self.train_score, self.val_score = None, None
 
 
@@ -203,7 +260,9 @@ class LstmRegressor():
         self.model, self.train_score, self.val_score = train_model(self.model, self.optimizer, self.loss,
                                                                    self.training_set, self.validation_set,
                                                                    self.batch_size, self.torch_device,
-                                                                   self.device_package,  self.max_epoch, self.max_ob_iter, print_iter=False)
+                                                                   self.device_package,  self.max_epoch, self.max_ob_iter, print_iter=False,
+                                                                   loader_config=self.loader_config,
+                                                                   seq2seq=self.seq2seq)
 
     def predict(self, test_set):
         self.evaluation_list, self.sample_num_list = evaluate_model(self.model, test_set, self.torch_device, self.device_package, self.batch_size)
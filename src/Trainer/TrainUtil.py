@@ -0,0 +1,99 @@
+import copy
+import numpy as np
+import torch
+from scipy import sparse
+
+
+def vstack_features(feature_list):
+    if sparse.issparse(feature_list[0]):
+        features = sparse.vstack(feature_list, format="csr")
+        features.sort_indices()
+        return features
+    return np.vstack(feature_list)
+
+
+def num_samples(x):
+    if isinstance(x, tuple):
+        return x[0].shape[0]
+    return x.shape[0]
+
+
+def batch_input(x, start, end, torch_device):
+    # In embedding mode x is a (codes, continuous) pair, the codes stay int32 on their way to the device
+    if isinstance(x, tuple):
+        codes, continuous = x
+        return codes[start:end].to(torch_device), continuous[start:end].float().to(torch_device)
+    return x[start:end].float().to(torch_device)
+
+
+def batch_label(y, start, end):
+    # Class ids of one batch, one-hot labels are collapsed here while int64 ids are used as they are
+    if y.dtype == torch.int64:
+        return y[start:end]
+    return y[start:end].float().argmax(dim=-1)
+
+
+# Label hooks of the epoch functions, they turn the labels of a batch into the target of the criterion
+def class_target(y):
+    return torch.flatten(batch_label(y, 0, None))
+
+
+def value_target(y):
+    return y.float().reshape((y.shape[0], -1))
+
+
+def weighted_loss(criterion, outputs, target, weights):
+    # Weighted mean of the per-sample losses, used when samples stand for several identical cases.
+    # A shallow copy gets reduction="none", the shared criterion is never modified
+    per_sample = copy.copy(criterion)
+    per_sample.reduction = "none"
+    loss = per_sample(outputs, target)
+    loss = loss.reshape(weights.shape[0], -1).mean(dim=-1)
+    return (loss * weights).sum() / weights.sum()
+
+
+def train_loader_epoch(model, loader, optimizer, criterion, torch_device, target, training=True):
+    # One pass over a PrefixLoader.prefix_loader, returns the summed loss and the summed sample weight
+    loss_sum = 0
+    weight_sum = 0
+    for x, y, weights, lengths in loader:
+        x = batch_input(x, 0, None, torch_device)
+        y = target(y).to(torch_device)
+        weights = weights.to(torch_device)
+        outputs = model(x, lengths=lengths)
+        loss = weighted_loss(criterion, outputs, y, weights)
+        if training:
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        loss_sum = loss_sum + loss.item() * weights.sum().item()
+        weight_sum = weight_sum + weights.sum().item()
+    return np.array([loss_sum]), np.array([weight_sum])
+
+
+def train_sequence_epoch(model, training_set, optimizer, criterion, torch_device, target, batch_size=50,
+                         training=True):
+    # Every case runs through the LSTM once and the loss is taken at all prefix steps, so an epoch costs
+    # O(events) LSTM steps. The returned weighted loss sum is the same objective as train_model_epoch
+    if training:
+        training_set.shuffle_data()
+    cases = training_set.order
+    loss_sum = 0
+    weight_sum = 0
+    for start in range(0, cases.shape[0], batch_size):
+        x, y, mask, weights = training_set.get_sequences(cases[start:start + batch_size])
+        if not mask.any():
+            continue
+        x = batch_input(x, 0, None, torch_device)
+        mask = mask.to(torch_device)
+        outputs = model(x, all_steps=True)[mask]
+        y = target(y[mask]).to(torch_device)
+        weights = weights.to(torch_device)[:, None].expand(mask.shape)[mask]
+        loss = weighted_loss(criterion, outputs, y, weights)
+        if training:
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        loss_sum = loss_sum + loss.item() * weights.sum().item()
+        weight_sum = weight_sum + weights.sum().item()
+    return np.array([loss_sum]), np.array([weight_sum])
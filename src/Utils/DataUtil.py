@@ -1,25 +1,93 @@
 import os
+import time
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from src.Utils import LogCache
+from src.Preprocessing import Categorical
 
 
-def read_files(folder_path, suffix=".pkl"):
+def read_file(file_path, suffix=".pkl"):
+    df = pd.DataFrame()
+    if suffix[-4:] == ".pkl":
+        df = pd.read_pickle(file_path)
+    elif suffix[-4:] == ".csv":
+        df = pd.read_csv(file_path, low_memory=False)
+    elif suffix[-5:] == ".json":
+        df = pd.read_json(file_path)
+    return df
+
+
+def read_file_worker(file_path, suffix=".pkl", use_cache=True):
+    # Cache index changes are returned instead of written, so with a process pool the parent
+    # process is the only writer of index.json
+    start_time = time.perf_counter()
+    update = None
+    if use_cache and suffix[-4:] != ".pkl":
+        df, update = LogCache.default_cache.load_entry(file_path, lambda path: read_file(path, suffix),
+                                                       tag=suffix.lstrip(".").replace(".", "_"))
+    else:
+        df = read_file(file_path, suffix)
+    return df, time.perf_counter() - start_time, update
+
+
+def read_file_timed(file_path, suffix=".pkl", use_cache=True):
+    df, elapsed, update = read_file_worker(file_path, suffix, use_cache)
+    if update is not None:
+        LogCache.default_cache.update_index(update)
+    return df, elapsed
+
+
+def read_files(folder_path, suffix=".pkl", use_cache=True, num_workers=1, max_inflight_bytes=1 << 30,
+               return_timing=False, intern=True):
     # Dictionary to hold DataFrames
     dataframes = {}
+    timing = {}
     # List all files in the folder
+    file_list = []
     for filename in os.listdir(folder_path):
-        # Check if the file is a CSV
+        # Check if the file has the requested suffix
         if filename.endswith(suffix):
-            file_path = os.path.join(folder_path, filename)
-            # Read the CSV file into a DataFrame
-            df = pd.DataFrame()
-            if suffix[-4:] == ".pkl":
-                df = pd.read_pickle(file_path)
-            elif suffix[-4:] == ".csv":
-                df = pd.read_csv(file_path, low_memory=False)
-            elif suffix[-5:] == ".json":
-                df = pd.read_json(file_path)
             # Use the filename without extension as the key
             key = os.path.splitext(filename)[0]
-            dataframes[key] = df
+            file_list.append((key, os.path.join(folder_path, filename)))
+
+    if num_workers <= 1:
+        for key, file_path in file_list:
+            dataframes[key], timing[key] = read_file_timed(file_path, suffix, use_cache)
+    else:
+        results = {}
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            pending = {}
+            inflight_bytes = 0
+            queue = list(file_list)
+            while queue or pending:
+                # Submit files while the size budget allows, but always keep at least one file in flight
+                while queue and (not pending or inflight_bytes + os.path.getsize(queue[0][1]) <= max_inflight_bytes):
+                    key, file_path = queue.pop(0)
+                    file_size = os.path.getsize(file_path)
+                    future = executor.submit(read_file_worker, file_path, suffix, use_cache)
+                    pending[future] = (key, file_size)
+                    inflight_bytes = inflight_bytes + file_size
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, file_size = pending.pop(future)
+                    inflight_bytes = inflight_bytes - file_size
+                    df, elapsed, update = future.result()
+                    if update is not None:
+                        LogCache.default_cache.update_index(update)
+                    results[key] = df, elapsed
+        for key, _ in file_list:
+            dataframes[key], timing[key] = results[key]
+
+    if intern:
+        # One vocabulary per call, every frame ends up with the same categories and codes
+        vocabulary = Categorical.Vocabulary()
+        for key in dataframes:
+            dataframes[key], _ = vocabulary.intern(dataframes[key])
+        for key in dataframes:
+            dataframes[key] = vocabulary.align(dataframes[key])
+
+    if return_timing:
+        return dataframes, timing
     return dataframes
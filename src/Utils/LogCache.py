@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cache")
+DEFAULT_MAX_BYTES = 2 << 30
+INDEX_FILE = "index.json"
+
+
+def file_digest(file_path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_string_array(values):
+    return values.dtype == object and pd.api.types.infer_dtype(values, skipna=False) == "string"
+
+
+def encode_strings(arrays, key, values):
+    # Strings as one flat utf-8 buffer plus offsets, so a single long value does not widen every row
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    arrays[key + "_offsets"] = offsets
+    arrays[key + "_bytes"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def decode_strings(arrays, key):
+    offsets = arrays[key + "_offsets"]
+    buffer = arrays[key + "_bytes"].tobytes()
+    values = np.empty(offsets.shape[0] - 1, dtype=object)
+    for i in range(values.shape[0]):
+        values[i] = buffer[offsets[i]:offsets[i + 1]].decode("utf-8")
+    return values
+
+
+def encode_frame(data):
+    # Split a DataFrame into plain column arrays plus a JSON description of how to rebuild it
+    if not isinstance(data.index, pd.RangeIndex) or data.index.start != 0 or data.index.step != 1:
+        return None
+    if not all(isinstance(name, str) for name in data.columns):
+        return None
+    arrays = {}
+    columns = []
+    for i, (name, series) in enumerate(data.items()):
+        key = "c%d" % i
+        dtype = series.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            arrays[key] = series.cat.codes.to_numpy()
+            categories = series.cat.categories.to_numpy()
+            string_categories = is_string_array(categories)
+            if string_categories:
+                encode_strings(arrays, key + "_categories", categories)
+            else:
+                arrays[key + "_categories"] = categories
+            columns.append({"name": name, "kind": "category", "ordered": bool(dtype.ordered),
+                            "string_categories": string_categories})
+        elif isinstance(dtype, pd.DatetimeTZDtype):
+            arrays[key] = series.array.asi8
+            columns.append({"name": name, "kind": "datetimetz", "tz": str(dtype.tz)})
+        elif isinstance(dtype, np.dtype) and is_string_array(series.to_numpy()):
+            # Object string columns are stored as codes over their distinct values
+            codes, uniques = pd.factorize(series.to_numpy())
+            arrays[key] = codes.astype(np.int32)
+            encode_strings(arrays, key + "_values", uniques)
+            columns.append({"name": name, "kind": "strings"})
+        elif isinstance(dtype, np.dtype):
+            arrays[key] = series.to_numpy()
+            columns.append({"name": name, "kind": "numpy", "dtype": str(dtype)})
+        else:
+            arrays[key] = series.to_numpy(dtype=object)
+            columns.append({"name": name, "kind": "extension", "dtype": str(dtype)})
+    # JSON-serializable attrs (e.g. the invalid timestamp rows of the stream reader) are kept as well
+    try:
+        attrs = json.loads(json.dumps(data.attrs))
+    except (TypeError, ValueError):
+        attrs = {}
+    arrays["__meta__"] = np.array(json.dumps({"columns": columns, "attrs": attrs}))
+    return arrays
+
+
+def decode_frame(arrays):
+    meta = json.loads(str(arrays["__meta__"]))
+    data = {}
+    for i, column in enumerate(meta["columns"]):
+        key = "c%d" % i
+        if column["kind"] == "category":
+            if column["string_categories"]:
+                categories = decode_strings(arrays, key + "_categories")
+            else:
+                categories = arrays[key + "_categories"].astype(object, copy=False)
+            data[column["name"]] = pd.Categorical.from_codes(arrays[key], categories=categories,
+                                                             ordered=column["ordered"])
+        elif column["kind"] == "datetimetz":
+            data[column["name"]] = pd.Series(arrays[key].view("datetime64[ns]")).dt.tz_localize(column["tz"])
+        elif column["kind"] == "strings":
+            data[column["name"]] = decode_strings(arrays, key + "_values")[arrays[key]]
+        elif column["kind"] == "numpy":
+            data[column["name"]] = arrays[key].astype(column["dtype"], copy=False)
+        else:
+            data[column["name"]] = pd.Series(arrays[key], dtype=object).astype(column["dtype"])
+    data = pd.DataFrame(data)
+    data.attrs.update(meta.get("attrs", {}))
+    return data
+
+
+class LogCache():
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+
+    def read_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {"entries": {}, "files": {}}
+
+    def write_index(self, index):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = os.path.join(self.cache_dir, "%s.%d.tmp" % (INDEX_FILE, os.getpid()))
+        with open(temp_path, "w") as file:
+            json.dump(index, file)
+        os.replace(temp_path, os.path.join(self.cache_dir, INDEX_FILE))
+
+    def source_digest(self, index, file_path):
+        # The content hash is only recomputed when size or mtime of the source file changed
+        stat = os.stat(file_path)
+        source = index["files"].get(file_path)
+        if source is None or source["size"] != stat.st_size or source["mtime_ns"] != stat.st_mtime_ns:
+            source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": file_digest(file_path)}
+            index["files"][file_path] = source
+        return "%s_%d" % (source["digest"], source["size"])
+
+    def load(self, file_path, loader, tag=""):
+        data, update = self.load_entry(file_path, loader, tag)
+        if update is not None:
+            self.update_index(update)
+        return data
+
+    def load_entry(self, file_path, loader, tag=""):
+        # Read through the cache without writing index.json. Returns the frame and the index changes
+        # (None for a plain hit), so parallel readers can hand them to a single writer
+        file_path = os.path.abspath(file_path)
+        index = self.read_index()
+        source = index["files"].get(file_path)
+        entry = self.source_digest(index, file_path)
+        update = {"files": {file_path: index["files"][file_path]}, "entries": {}}
+        if tag:
+            entry = entry + "_" + tag
+        entry_path = os.path.join(self.cache_dir, entry + ".npz")
+
+        if entry in index["entries"] and os.path.isfile(entry_path):
+            try:
+                with np.load(entry_path, allow_pickle=True) as arrays:
+                    data = decode_frame(arrays)
+                # A hit only touches the entry file, the index is rewritten when the source stat changed
+                os.utime(entry_path)
+                if index["files"][file_path] is not source:
+                    return data, update
+                return data, None
+            except (OSError, ValueError, KeyError):
+                self.remove_entry(index, entry)
+                update["entries"][entry] = None
+
+        data = loader(file_path)
+        arrays = encode_frame(data)
+        if arrays is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = os.path.join(self.cache_dir, "%s.%d.tmp.npz" % (entry, os.getpid()))
+            np.savez(temp_path, **arrays)
+            os.replace(temp_path, entry_path)
+            update["entries"][entry] = {"source": file_path, "bytes": os.path.getsize(entry_path),
+                                        "last_used": time.time()}
+        return data, update
+
+    def update_index(self, update):
+        # Merge the changes of load_entry into the current index, entries set to None are dropped
+        index = self.read_index()
+        index["files"].update(update["files"])
+        for entry, info in update["entries"].items():
+            if info is None:
+                index["entries"].pop(entry, None)
+            else:
+                index["entries"][entry] = info
+        self.evict(index)
+        self.write_index(index)
+
+    def remove_entry(self, index, entry):
+        index["entries"].pop(entry, None)
+        entry_path = os.path.join(self.cache_dir, entry + ".npz")
+        if os.path.isfile(entry_path):
+            os.remove(entry_path)
+
+    def last_used(self, entry, info):
+        entry_path = os.path.join(self.cache_dir, entry + ".npz")
+        if os.path.isfile(entry_path):
+            return max(info["last_used"], os.path.getmtime(entry_path))
+        return info["last_used"]
+
+    def evict(self, index):
+        # Drop least recently used entries until the cache fits into max_bytes
+        entries = sorted(index["entries"].items(), key=lambda item: self.last_used(*item))
+        total_bytes = sum(info["bytes"] for _, info in entries)
+        for entry, info in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            self.remove_entry(index, entry)
+            total_bytes = total_bytes - info["bytes"]
+
+    def invalidate(self, file_path=None):
+        # Remove the cached frames of one source file, or the whole cache if no file is given
+        index = self.read_index()
+        if file_path is None:
+            for entry in list(index["entries"]):
+                self.remove_entry(index, entry)
+            index["files"] = {}
+        else:
+            file_path = os.path.abspath(file_path)
+            source = index["files"].pop(file_path, None)
+            for entry, info in list(index["entries"].items()):
+                if info["source"] == file_path or (source is not None and entry.startswith(source["digest"])):
+                    self.remove_entry(index, entry)
+        self.write_index(index)
+
+
+default_cache = LogCache()